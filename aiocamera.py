@@ -0,0 +1,181 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+asyncio interface to ToupCamCamera
+
+    async with AsyncToupCam(resolution=1) as cam:
+        await cam.set_exposure_time(2000)
+        async for frame in cam.frames():
+            with frame:
+                ...
+
+Frame callbacks are forwarded to the event loop with call_soon_threadsafe
+into a bounded queue, nothing in the loop blocks on the camera. Calls into
+the SDK run on one executor thread per camera, in order.
+"""
+# ============= standard library imports ========================
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+# ============= local library imports  ==========================
+from camera import ToupCamCamera
+from worker import DROP_OLDEST
+
+
+class AsyncToupCam(object):
+    """
+        wrap a ToupCamCamera, or create one from camera_kw.
+
+        maxsize bounds the queue of frames waiting for next_frame, when it is
+        full the oldest is discarded and counted in dropped. Frames are leased
+        when they are taken from the queue, a frame overwritten by then is
+        counted in missed.
+
+        every set_*/get_* method of the camera is available as a coroutine,
+        e.g. await cam.set_exposure_time(1000)
+    """
+
+    def __init__(self, camera=None, maxsize=4, **camera_kw):
+        if camera is None:
+            camera = ToupCamCamera(**camera_kw)
+
+        self.camera = camera
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.missed = 0
+
+        self._loop = None
+        self._queue = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='toupcam-async')
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __getattr__(self, name):
+        if name.startswith(('set_', 'get_')):
+            func = getattr(self.camera, name)
+
+            async def call(*args, **kw):
+                return await self._call(func, *args, **kw)
+
+            call.__name__ = name
+            call.__doc__ = func.__doc__
+            return call
+
+        raise AttributeError(name)
+
+    async def open(self, policy=DROP_OLDEST, queue_size=8):
+        'open the camera, frames are queued from now on'
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.maxsize)
+        ok = await self._call(self.camera.cam_open, policy, queue_size)
+        if not ok:
+            raise IOError('Failed to open camera')
+
+        self.camera.add_frame_callback(self._on_frame)
+
+    async def close(self):
+        if self._queue is None:
+            return
+
+        try:
+            self.camera.remove_frame_callback(self._on_frame)
+        except ValueError:
+            pass
+
+        await self._call(self.camera.cam_close)
+        self._executor.shutdown()
+        self._queue = None
+
+    async def next_frame(self, timeout=None):
+        'the next leased Frame, release it when done. None on timeout'
+        queue = self._queue
+        while 1:
+            try:
+                seq = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return
+
+            frame = self.camera.get_frame(seq)
+            if frame is not None:
+                return frame
+            self.missed += 1
+
+    async def frames(self, timeout=None):
+        'yield leased Frames until one takes longer than timeout'
+        while 1:
+            frame = await self.next_frame(timeout)
+            if frame is None:
+                return
+            yield frame
+
+    async def snap(self, path=None, timeout=5):
+        """
+            snap a still at the current resolution and return it as an array.
+            with path the still is saved instead and the file name is
+            returned once it is written
+        """
+        cam = self.camera
+        if path is not None:
+            # resolved by the writer once this still is on disk
+            future = await self._call(cam.snap_future, path)
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+        burst = await self._call(cam.snap_burst, 1, None, True)
+        if burst is None:
+            raise IOError('Camera not open')
+
+        stills = await self._call(burst.wait, timeout)
+        if not len(stills):
+            if burst.error:
+                raise IOError('Snap failed, {}'.format(burst.error))
+            raise asyncio.TimeoutError()
+        return stills[0]
+
+    async def trigger(self, timeout=None):
+        'fire a trigger, see ToupCamCamera.trigger, and return the leased Frame'
+        future = await self._call(self.camera.trigger)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    # private
+    def _call(self, func, *args, **kw):
+        'run func on the camera executor thread'
+        return self._loop.run_in_executor(self._executor, functools.partial(func, *args, **kw))
+
+    def _on_frame(self, seq, timestamp):
+        'runs on the camera worker thread'
+        try:
+            self._loop.call_soon_threadsafe(self._put, seq)
+        except RuntimeError:
+            # the loop is closed
+            pass
+
+    def _put(self, seq):
+        queue = self._queue
+        if queue is None:
+            return
+
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(seq)
+
+# ============= EOF =============================================
@@ -0,0 +1,365 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Single file archive of losslessly compressed frames with random access.
+
+Layout, all little endian:
+    file header: magic, version, json metadata (e.g. camera serial)
+    chunks: chunk header (magic, frame count, json length, data length),
+        json list of the frame records of the chunk, zlib compressed data
+    index: json list of every frame record with the offset of its chunk
+    footer: index offset, index length, magic
+
+Frames of more than one byte per sample are stored byte shuffled (all low
+bytes, then all high bytes), which compresses 10-16 bit data much better.
+A frame is read with one seek and one chunk decompression. The index is
+rebuilt from the chunk headers if the archive was not closed.
+"""
+# ============= standard library imports ========================
+import json
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+# ============= local library imports  ==========================
+from worker import EventWorker, DROP_NEWEST
+
+MAGIC = b'TCARC\x00\x00\x01'
+CHUNK_MAGIC = b'CHNK'
+FOOTER_MAGIC = b'TCIDX\x00\x00\x01'
+
+_FILE_HEADER = struct.Struct('<8sI')
+_CHUNK_HEADER = struct.Struct('<4sIII')
+_FOOTER = struct.Struct('<QQ8s')
+
+
+def _shuffle(data):
+    'the bytes of data grouped by significance'
+    itemsize = data.dtype.itemsize
+    if itemsize == 1:
+        return np.ascontiguousarray(data).tobytes()
+    return np.ascontiguousarray(data).view(np.uint8).reshape(-1, itemsize).T.tobytes()
+
+
+def _unshuffle(buf, dtype, shape):
+    dtype = np.dtype(dtype)
+    raw = np.frombuffer(buf, np.uint8)
+    if dtype.itemsize > 1:
+        raw = np.ascontiguousarray(raw.reshape(dtype.itemsize, -1).T)
+    return raw.view(dtype).reshape(shape)
+
+
+def camera_meta(camera):
+    'per frame camera settings for ArchiveWriter.append'
+    meta = dict(exposure=camera.get_exposure_time(), gain=camera.get_analog_gain())
+    tt = camera.get_temperature_tint()
+    if tt:
+        meta['temp'], meta['tint'] = tt
+    return meta
+
+
+class ArchiveWriter(object):
+    """
+        append frames to an archive, chunk_frames frames are compressed
+        together. zlib only looks back 32 KB so grouping large frames does
+        not compress better and makes random reads decompress the whole
+        chunk, group small frames (ROI, binned) to cut per chunk overhead.
+
+            with ArchiveWriter('run1.tca', meta={'serial': serial}) as arc:
+                arc.append(frame.data, frame.seq, frame.timestamp, exposure=1000)
+
+        attach(camera) archives every frame of a camera and adds its serial
+        to meta, compression runs on a background thread. the file header
+        (meta) is written with the first chunk
+    """
+
+    def __init__(self, path, chunk_frames=1, level=1, meta=None):
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.level = level
+        self.count = 0
+        self.dropped = 0
+        self.meta = dict(meta or {})
+
+        self._file = open(path, 'wb')
+        self._header_written = False
+        self._index = []
+        self._pending = []
+        self._lock = threading.Lock()
+        self._camera = None
+        self._worker = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, data, seq=None, timestamp=0.0, **meta):
+        """
+            add a frame. meta is stored with it, e.g. exposure, gain, temp,
+            tint (see camera_meta)
+        """
+        data = np.asarray(data)
+        with self._lock:
+            if seq is None:
+                seq = self.count + 1
+
+            record = dict(seq=seq, timestamp=timestamp, shape=data.shape, dtype=data.dtype.str)
+            if meta:
+                record['meta'] = meta
+            self._pending.append((record, _shuffle(data)))
+            self.count += 1
+            if len(self._pending) >= self.chunk_frames:
+                self._write_chunk()
+
+    def attach(self, camera, maxsize=16):
+        """
+            archive every frame of camera. frames are copied on the camera
+            worker thread and compressed on the archive thread, frames are
+            dropped (counted in dropped) when the archive falls behind
+        """
+        with self._lock:
+            if not self._header_written:
+                self.meta = camera.get_recording_spec(self.meta)[3]
+
+        self._camera = camera
+        self._worker = EventWorker(self._compress, maxsize, DROP_NEWEST, name='toupcam-archive')
+        self._worker.start()
+        camera.add_frame_callback(self._on_frame)
+
+    def detach(self):
+        if self._camera is not None:
+            self._camera.remove_frame_callback(self._on_frame)
+            self._camera = None
+        if self._worker is not None:
+            self._worker.stop()
+            self.dropped += self._worker.dropped
+            self._worker = None
+
+    def close(self):
+        'write the last chunk and the index'
+        self.detach()
+        with self._lock:
+            if self._file is None:
+                return
+
+            if self._pending:
+                self._write_chunk()
+            else:
+                self._write_header()
+
+            f = self._file
+            offset = f.tell()
+            text = json.dumps(self._index).encode('utf8')
+            f.write(text)
+            f.write(_FOOTER.pack(offset, len(text), FOOTER_MAGIC))
+            f.close()
+            self._file = None
+
+    # private
+    def _write_header(self):
+        if not self._header_written:
+            text = json.dumps(self.meta).encode('utf8')
+            self._file.write(_FILE_HEADER.pack(MAGIC, len(text)) + text)
+            self._header_written = True
+
+    def _write_chunk(self):
+        self._write_header()
+        f = self._file
+        offset = f.tell()
+        records = []
+        pos = 0
+        for record, buf in self._pending:
+            record['pos'] = pos
+            record['nbytes'] = len(buf)
+            pos += len(buf)
+            records.append(record)
+
+        data = zlib.compress(b''.join(buf for _, buf in self._pending), self.level)
+        text = json.dumps(records).encode('utf8')
+        f.write(_CHUNK_HEADER.pack(CHUNK_MAGIC, len(records), len(text), len(data)))
+        f.write(text)
+        f.write(data)
+
+        for record in records:
+            record['chunk'] = offset
+        self._index.extend(records)
+        self._pending = []
+
+    def _on_frame(self, seq, timestamp):
+        'runs on the camera worker thread'
+        frame = self._camera.get_frame(seq)
+        if frame is None:
+            self.dropped += 1
+            return
+
+        with frame:
+            data = frame.copy()
+            fm = frame.meta
+
+        if fm is None:
+            meta = camera_meta(self._camera)
+        else:
+            # recorded with the frame, no SDK calls per frame
+            meta = dict(exposure=fm.exposure_time, gain=fm.gain)
+            if fm.temperature is not None:
+                meta['temp'], meta['tint'] = fm.temperature, fm.tint
+        self._worker.post((data, seq, timestamp, meta))
+
+    def _compress(self, job, timestamp):
+        data, seq, ts, meta = job
+        self.append(data, seq, ts, **meta)
+
+
+class Archive(object):
+    """
+        read an archive written by ArchiveWriter:
+
+            arc = Archive('run1.tca')
+            frame = arc[10]
+            frame = arc[arc.find_seq(1234)]
+            arc.record(10)['meta']['exposure']
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = f = open(path, 'rb')
+        magic, n = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('{} is not an archive'.format(path))
+        self.meta = json.loads(f.read(n).decode('utf8'))
+        self._first_chunk = f.tell()
+
+        self.index = self._read_index()
+        if self.index is None:
+            self.index = self._scan()
+
+        self._seqs = np.array([r['seq'] for r in self.index], dtype=np.int64)
+        self._stamps = np.array([r['timestamp'] for r in self.index], dtype=np.float64)
+        self._chunk = (None, None)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        r = self.index[i]
+        buf = self._read_chunk(r['chunk'])
+        return _unshuffle(buf[r['pos']:r['pos'] + r['nbytes']], r['dtype'], r['shape'])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        self._file.close()
+
+    def record(self, i):
+        'seq, timestamp, shape, dtype and meta of frame i'
+        return self.index[i]
+
+    @property
+    def seqs(self):
+        return self._seqs
+
+    @property
+    def timestamps(self):
+        return self._stamps
+
+    def find_seq(self, seq):
+        'position of the frame with sequence number seq, None if it is not archived'
+        i = int(np.searchsorted(self._seqs, seq))
+        if i < len(self._seqs) and self._seqs[i] == seq:
+            return i
+
+    def find_time(self, timestamp):
+        'position of the frame closest to timestamp'
+        ts = self._stamps
+        if not len(ts):
+            return
+
+        i = int(np.searchsorted(ts, timestamp))
+        if i == len(ts) or (i and timestamp - ts[i - 1] < ts[i] - timestamp):
+            i -= 1
+        return i
+
+    # private
+    def _read_chunk(self, offset):
+        'decompressed data of the chunk at offset, the last chunk read is cached'
+        with self._lock:
+            cached_offset, buf = self._chunk
+            if cached_offset == offset:
+                return buf
+
+            f = self._file
+            f.seek(offset)
+            magic, _, n, size = _CHUNK_HEADER.unpack(f.read(_CHUNK_HEADER.size))
+            if magic != CHUNK_MAGIC:
+                raise IOError('Corrupt chunk at {}'.format(offset))
+            f.seek(n, os.SEEK_CUR)
+            buf = zlib.decompress(f.read(size))
+            self._chunk = (offset, buf)
+            return buf
+
+    def _read_index(self):
+        f = self._file
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if end - self._first_chunk < _FOOTER.size:
+            return
+
+        f.seek(end - _FOOTER.size)
+        offset, n, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+        if magic != FOOTER_MAGIC:
+            return
+
+        f.seek(offset)
+        return json.loads(f.read(n).decode('utf8'))
+
+    def _scan(self):
+        'rebuild the index from the chunk headers of an archive that was not closed'
+        f = self._file
+        index = []
+        offset = self._first_chunk
+        f.seek(offset)
+        while 1:
+            head = f.read(_CHUNK_HEADER.size)
+            if len(head) < _CHUNK_HEADER.size:
+                break
+
+            magic, _, n, size = _CHUNK_HEADER.unpack(head)
+            text = f.read(n)
+            if magic != CHUNK_MAGIC or len(text) < n or len(f.read(size)) < size:
+                # truncated last chunk
+                break
+
+            for record in json.loads(text.decode('utf8')):
+                record['chunk'] = offset
+                index.append(record)
+            offset = f.tell()
+        return index
+
+# ============= EOF =============================================
@@ -0,0 +1,336 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Pre-allocated frame buffers shared between the camera callback and consumers
+"""
+# ============= standard library imports ========================
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+# ============= local library imports  ==========================
+
+# camera state when a frame was pulled. exposure_time in us, gain in percent,
+# esize the resolution index, roi the hardware (x, y, w, h) or None
+FrameMetadata = namedtuple('FrameMetadata', 'seq timestamp width height exposure_time gain temperature tint '
+                                            'esize roi')
+
+
+class Frame(object):
+    """
+        a leased slot of a FrameRing.
+
+        The ring does not write into the slot until the lease is released,
+        either explicitly with release(), by leaving a ``with`` block or when
+        the Frame is garbage collected. No copy of the pixels is made:
+
+            with cam.get_next_frame() as frame:
+                arr = np.asarray(frame)       # __array_interface__
+                image = PIL.Image.fromarray(frame.data)
+                sock.sendall(frame.memoryview())
+    """
+
+    def __init__(self, ring, slot, seq, timestamp, meta=None):
+        self.ring = ring
+        self.slot = slot
+        self.seq = seq
+        self.timestamp = timestamp
+        self._meta = meta
+        self._released = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def __del__(self):
+        self.release()
+
+    @property
+    def data(self):
+        'the slot array, only valid until the frame is released'
+        return self.ring.get_slot(self.slot)
+
+    @property
+    def meta(self):
+        'the FrameMetadata recorded with the frame, None if the producer gave none'
+        if self._meta is not None:
+            return FrameMetadata(self.seq, self.timestamp, *self._meta)
+
+    @property
+    def shape(self):
+        return self.ring.shape
+
+    @property
+    def format(self):
+        'the raw.RawFormat of raw frames, None for RGB and gray frames'
+        return self.ring.format
+
+    @property
+    def dtype(self):
+        return self.ring.dtype
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    @property
+    def __array_interface__(self):
+        return self.data.__array_interface__
+
+    def __buffer__(self, flags):
+        # buffer protocol for python >= 3.12
+        return memoryview(self.data)
+
+    def memoryview(self):
+        'a flat byte memoryview of the pixels'
+        return memoryview(self.data).cast('B')
+
+    def copy(self):
+        return self.data.copy()
+
+    def release(self):
+        'give the slot back to the ring'
+        if not self._released:
+            self._released = True
+            self.ring.release(self.slot)
+
+    def is_current(self):
+        'true if the slot still holds this frame'
+        return self.ring.is_current(self)
+
+
+class FrameRing(object):
+    """
+        N-slot ring of pre-allocated numpy buffers.
+
+        The producer (camera callback) pulls each frame into the slot returned
+        by begin_write and then calls commit (or abort if the pull failed).
+        Consumers ask for the latest frame or the next unread frame and get a
+        Frame that leases its slot, leased slots are skipped by the producer.
+        Every committed frame gets a sequence number starting at 1. Only
+        next() moves the read cursor, latest() and lease() do not. A frame
+        that could not be pulled because every slot was leased is counted as
+        dropped, frames next() never returned because they were overwritten
+        show up as gaps in its sequence numbers.
+        fmt describes the pixels of raw frames, see raw.RawFormat
+    """
+
+    def __init__(self, shape, dtype, nslots=4, fmt=None):
+        if nslots < 2:
+            raise ValueError('FrameRing needs at least 2 slots')
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.format = fmt
+        self._slots = [np.zeros(shape, dtype=dtype) for _ in range(nslots)]
+        self._seqs = [0] * nslots
+        self._stamps = [0.0] * nslots
+        self._metas = [None] * nslots
+        self._leases = [0] * nslots
+
+        self._cond = threading.Condition()
+        self._write_slot = 0
+        self._seq = 0
+        self._read_seq = 0
+
+        self.count = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    # producer
+    def begin_write(self):
+        """
+            return (slot, buffer) to pull the next frame into.
+            return (None, None) if every slot is leased
+        """
+        with self._cond:
+            n = len(self._slots)
+            for i in range(n):
+                slot = (self._write_slot + i) % n
+                if not self._leases[slot]:
+                    break
+            else:
+                self.dropped += 1
+                return None, None
+
+            # the slot is invalid until commit
+            self._seqs[slot] = 0
+            return slot, self._slots[slot]
+
+    def commit(self, slot, timestamp=None, meta=None):
+        """
+            publish the frame written into slot. meta is the tuple of the
+            FrameMetadata fields after seq and timestamp
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        with self._cond:
+            self._seq += 1
+            self._seqs[slot] = self._seq
+            self._stamps[slot] = timestamp
+            self._metas[slot] = meta
+            self._write_slot = (slot + 1) % len(self._slots)
+            self.count += 1
+            self._cond.notify_all()
+            return self._seq
+
+    def abort(self, slot):
+        'the pull into slot failed, the slot is reused by the next begin_write'
+        pass
+
+    # consumer
+    def get_slot(self, slot):
+        return self._slots[slot]
+
+    def is_current(self, frame):
+        return self._seqs[frame.slot] == frame.seq
+
+    def latest(self):
+        'lease the most recent Frame, None if there is none'
+        with self._cond:
+            return self._latest()
+
+    def next(self, timeout=None):
+        """
+            lease the oldest Frame not yet read, waiting up to timeout seconds.
+            return None if timeout expires
+        """
+        with self._cond:
+            if not self._cond.wait_for(self._has_unread, timeout):
+                return
+
+            seq, slot = min((s, i) for i, s in enumerate(self._seqs) if s > self._read_seq)
+            self._read_seq = seq
+            return self._lease(slot)
+
+    def lease(self, seq, mark_read=False):
+        """
+            lease the Frame with sequence number seq, None if it was
+            overwritten. with mark_read next() continues after it
+        """
+        with self._cond:
+            try:
+                slot = self._seqs.index(seq)
+            except ValueError:
+                return
+
+            if mark_read:
+                self._read_seq = max(self._read_seq, seq)
+            return self._lease(slot)
+
+    def release(self, slot):
+        with self._cond:
+            self._leases[slot] -= 1
+
+    def leased(self):
+        'number of slots currently leased'
+        with self._cond:
+            return sum(1 for l in self._leases if l)
+
+    # private
+    def _has_unread(self):
+        return self._seq > self._read_seq and any(s > self._read_seq for s in self._seqs)
+
+    def _lease(self, slot):
+        self._leases[slot] += 1
+        return Frame(self, slot, self._seqs[slot], self._stamps[slot], self._metas[slot])
+
+    def _latest(self):
+        seq = self._seq
+        if not seq:
+            return
+
+        try:
+            slot = self._seqs.index(seq)
+        except ValueError:
+            return
+
+        return self._lease(slot)
+
+class StillBurst(object):
+    """
+        pre-allocated (n, h, w[, c]) stack that the camera worker fills with
+        the stills of one Toupcam_SnapN burst
+    """
+
+    def __init__(self, n, shape, dtype):
+        self.stack = np.empty((n,) + tuple(shape), dtype=dtype)
+        self.timestamps = np.zeros(n)
+        self.count = 0
+        # why the burst ended early, None if it was not cancelled
+        self.error = None
+        self._cancelled = False
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.stack)
+
+    def __iter__(self):
+        return self.frames()
+
+    def is_done(self):
+        return self._cancelled or self.count == len(self.stack)
+
+    # producer
+    def next_buffer(self):
+        'the buffer the next still is pulled into'
+        return self.stack[self.count]
+
+    def commit(self, timestamp):
+        with self._cond:
+            self.timestamps[self.count] = timestamp
+            self.count += 1
+            self._cond.notify_all()
+
+    def cancel(self, error='cancelled'):
+        with self._cond:
+            self.error = error
+            self._cancelled = True
+            self._cond.notify_all()
+
+    # consumer
+    def wait(self, timeout=None):
+        'wait for the burst to finish and return the stack of stills received'
+        with self._cond:
+            self._cond.wait_for(self.is_done, timeout)
+            return self.stack[:self.count]
+
+    def frames(self, timeout=None):
+        """
+            yield (array, timestamp) for each still as it arrives. stops when
+            the burst is done or no still arrived within timeout seconds
+        """
+        i = 0
+        while i < len(self.stack):
+            with self._cond:
+                if not self._cond.wait_for(lambda: self.count > i or self._cancelled, timeout):
+                    return
+                if i >= self.count:
+                    return
+                n = self.count
+
+            for j in range(i, n):
+                yield self.stack[j], self.timestamps[j]
+            i = n
+
+# ============= EOF =============================================
@@ -21,143 +21,97 @@ and support for capturing raw format
 """
 # ============= standard library imports ========================
 import ctypes
-import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
 import numpy as np
-import PIL
-from io import StringIO
 
 # ============= local library imports  ==========================
-from core import lib, TOUPCAM_EVENT_IMAGE, TOUPCAM_EVENT_STILLIMAGE, success, HToupCam
-
-
-class ToupCamCameraRaw(object):
-    'ToupCam python cDLL Interface for raw image output'
-    _frame_fn = None
-    _save_path = 'temp.png'
-
-    def __init__(self, resolution=2, bits=32):
-        if bits not in (32,):
-            raise ValueError('Bits needs to by 8 or 32')
-        # bits = 8
-        self.resolution = resolution
-        self.cam = self.get_camera()
-        self.bits = bits
-
-    @classmethod
-    def get_camera(cls, cid=None):
-        'returns the camera id'
-        func = lib.Toupcam_Open
-        func.restype = ctypes.POINTER(HToupCam)
-        return func(cid)
-
-    @classmethod
-    def get_pil_image(cls, data):
-        'convert PIL image data to an Image object'
-        # TODO fix RAW image conversion
-
-        raw = data.view(np.uint8).reshape(data.shape + (-1,))
-        bgr = raw[..., :3]
-        image = PIL.Image.fromarray(bgr, 'RGB')
-        b, g, r = image.split()
-        return PIL.Image.merge('RGB', (r, g, b))
-
-    def _do_save(self, imagedata):
-        'save PIL image to the path, called by the callback function'
-        image_PIL = self.get_pil_image(imagedata)
-        image_PIL.save(self._save_path)
-
-    def cam_open(self):
-        'Open camera'
-        self.set_esize(self.resolution)
-        args = self.get_size()
-        if not args:
-            print('Camera not open!')
-            return
-
-        def get_frame(nEvent, ctx):
-            'callback function, to be stored in _frame_fn'
-            #ctx is not used
-            if nEvent == TOUPCAM_EVENT_STILLIMAGE:
-                w, h = self.get_size()
-                h, w = h.value, w.value
-
-                still = np.zeros((h, w), dtype=np.uint32)
-                lib.Toupcam_PullStillImage(self.cam, ctypes.c_void_p(
-                    still.ctypes.data), None, None, None)
-                # lib.Toupcam_PullStillImage(handle,void_pointer_pImageData,
-                # int bits,unsigned pointer pnWidth,unsigned pointer pnHeight)
-                self._do_save(still)
-
-        # converts get_frame into a C function
-        # with None returned, and arguments (int, void*)
-        callback = ctypes.CFUNCTYPE(None, ctypes.c_uint, ctypes.c_void_p)
-        self._frame_fn = callback(get_frame)
-
-        # try to set camera to raw output
-        result1 = lib.Toupcam_put_option(
-            self.cam, ctypes.c_uint(0x04), ctypes.c_uint(0x1))
-        print('set to raw? result = {}'.format(result1))
-
-        # Start Camera Pull Mode
-        result = lib.Toupcam_StartPullModeWithCallback(
-            self.cam, self._frame_fn)
-        return success(result)
-
-    def cam_close(self):
-        'close camera'
-        if self.cam:
-            lib.Toupcam_Close(self.cam)
-
-    def snap(self):
-        'snap a single image'
-        lib.Toupcam_Snap(self.cam, ctypes.c_uint(0))
-
-    def get_raw_format(self):
-        'get raw format'
-        nFourCC = ctypes.c_uint(0)
-        bitsPerPixel = ctypes.c_uint(0)
-        result = lib.Toupcam_get_RawFormat(
-            self.cam, ctypes.byref(nFourCC), ctypes.byref(bitsPerPixel))
-        if success(result):
-            print(bitsPerPixel.value)
-            print(nFourCC.value)
-            return nFourCC.value
-        # {
-            #	wchar_t str[257];
-            #	swprintf(str, L"FourCC:0x%08x, %c%c%c%c\nBits per Pixel: %u",
-            # nFourCC, (char)(nFourCC & 0xff), (char)((nFourCC >> 8) & 0xff),
-            # (char)((nFourCC >> 16) & 0xff), (char)((nFourCC >> 24) & 0xff),
-            # bitsperpixel);
-            #	AtlMessageBox(m_hWnd, str, L"Raw Format");
-            # }
-
-    def set_esize(self, nres):
-        'set e size, nres = 0,1,or 2'
-        lib.Toupcam_put_eSize(self.cam, ctypes.c_ulong(nres))
-
-    def get_size(self):
-        'get width and height of image in pixels'
-        w, h = ctypes.c_long(), ctypes.c_long()
-
-        result = lib.Toupcam_get_Size(
-            self.cam, ctypes.byref(w), ctypes.byref(h))
-        if success(result):
-            return w, h
+import convert
+import demosaic
+import encoder
+from buffers import FrameRing, StillBurst
+from stats import LatencyHistogram
+from core import lib, TOUPCAM_EVENT_IMAGE, TOUPCAM_EVENT_STILLIMAGE, TOUPCAM_EVENT_EXPOSURE, TOUPCAM_EVENT_TEMPTINT, \
+    TOUPCAM_OPTION_TRIGGER, TOUPCAM_OPTION_BINNING, TOUPCAM_OPTION_RAW, TOUPCAM_OPTION_BITDEPTH, success, \
+    EVENT_CALLBACK, TEMPTINT_CALLBACK
+from raw import RawFormat
+from worker import EventWorker, DROP_OLDEST
+from writer import ImageWriter
+
+# 8 bits gray, RGB24, RGB32
+BITS = (8, 24, 32)
+
+# TOUPCAM_OPTION_TRIGGER values
+TRIGGER_VIDEO = 0
+TRIGGER_SOFTWARE = 1
+TRIGGER_EXTERNAL = 2
+TRIGGER_CONTINUOUS = 0xffff
+
+
+def frame_layout(bits, w, h):
+    """
+        return (shape, dtype, row pitch) of a frame pulled with bits.
+        rows are tightly packed, RGB32 frames are kept as one uint32 per pixel
+    """
+    if bits == 8:
+        return (h, w), np.uint8, w
+    elif bits == 24:
+        return (h, w, 3), np.uint8, w * 3
+    else:
+        return (h, w), np.uint32, w * 4
 
 
 class ToupCamCamera(object):
-    _data = None
+    _ring = None
+    _worker = None
     _frame_fn = None
     _temptint_cb = None
-    _save_path = None
-
-    def __init__(self, resolution=2, bits=32):
-        if bits not in (32,):
-            raise ValueError('Bits needs to by 8 or 32')
-        # bits = 8
+    _writer = None
+    _burst = None
+    _trigger_mode = TRIGGER_VIDEO
+    # raw.RawFormat of the frames in raw mode
+    frame_format = None
+    _save_path = 'still_{serial}_{seq:05d}.png'
+
+    _hw_roi = None
+    _soft_roi = None
+    _hw_bin = 1
+    _soft_bin = None
+
+    # (exposure time, gain) and (temperature, tint), updated from SDK events
+    # and recorded with every frame, see buffers.FrameMetadata
+    _exposure = (None, None)
+    _temptint = (None, None)
+
+    def __init__(self, resolution=2, bits=32, nbuffers=4, cid=None):
+        """
+            cid is the id of the camera to open, see core.enum_cameras.
+            None opens the first camera
+        """
+        if bits not in BITS:
+            raise ValueError('Bits needs to be 8, 24 or 32')
         self.resolution = resolution
-        self.cam = self.get_camera()
+        self.cid = cid
+        self.cam = self.get_camera(cid)
         self.bits = bits
+        self.nbuffers = nbuffers
+        # (path, future) of snaps whose still has not reached the writer yet
+        self._snap_paths = deque()
+        self._snap_cond = threading.Condition()
+        self._frame_callbacks = []
+        # ext: encoder(data, path) of the still writer, see set_encoder
+        self._encoders = {}
+        self._skipped = 0
+        self._triggers = deque()
+        self._trigger_lock = threading.Lock()
+        # held while a frame is pulled, the ring is reallocated under it
+        self._pull_lock = threading.Lock()
+        self._pitch = ctypes.c_int(0)
+        self.trigger_latency = LatencyHistogram()
+        self._funcs = lib.table()
 
     # icamera interface
     def save(self, p, extension='JPEG', *args, **kw):
@@ -173,131 +127,715 @@ class ToupCamCamera(object):
         im = self.get_pil_image()
         im.save(p, 'TIFF')
 
-    def get_jpeg_data(self, data=None, quality=75):
+    def get_jpeg_data(self, data=None, quality=75, subsampling='4:2:0'):
+        'JPEG bytes of the frame, see encoder.JpegEncoder to encode many frames'
+        return encoder.encode_jpeg(self.get_pil_image(data), quality, subsampling)
 
-        im = self.get_pil_image(data)
+    def get_pil_image(self, data=None):
+        if data is None:
+            return self._with_latest(self.get_pil_image)
 
-        s = StringIO()
-        im.save(s, 'JPEG', quality=quality)
-        s.seek(0, os.SEEK_END)
+        data = self._soft_process(data)
 
-        return s.getvalue()
+        return convert.to_pil_image(data)
 
-    def get_pil_image(self, data=None):
-        # im = self._data
+    def snap(self, path=None):
+        """
+            snap a still at the current resolution. returns immediately, the
+            still is saved to path (or the save path template) by the writer
+            thread, see flush_saves
+        """
+        return self._snap(path)[0]
+
+    def snap_future(self, path=None):
+        """
+            snap like snap() and return a concurrent.futures.Future resolved
+            with the file name once the still is written:
+
+                path = cam.snap_future('a.png').result(timeout=5)
+        """
+        return self._snap(path)[1]
+
+    def snap_burst(self, n, timeout=None, stream=False):
+        """
+            snap n stills with Toupcam_SnapN at the current resolution.
+
+            the stills are pulled straight into one pre-allocated stack sized
+            for full frames at the current resolution, stills are not cropped
+            or binned. returns the (n, h, w[, c]) array, shorter if timeout
+            expires first or the burst failed (see StillBurst.error).
+            if stream is True return the StillBurst immediately, iterate it to
+            get (array, timestamp) for each still as it arrives
+        """
+        if self._ring is None:
+            return
+
+        size = self._still_size()
+        if size is None:
+            return
+
+        shape, dtype, _ = self._frame_layout(*size)
+        burst = StillBurst(n, shape, dtype)
+        self._burst = burst
+        if 'SnapN' in self._funcs:
+            ok = self._lib_func('SnapN', self.resolution, n)
+        else:
+            # older SDKs only have Toupcam_Snap
+            ok = all(self._lib_func('Snap', self.resolution) for _ in range(n))
+
+        if not ok:
+            self._burst = None
+            burst.cancel('Toupcam_SnapN failed')
+
+        if stream:
+            return burst
+        return burst.wait(timeout)
+
+    def set_save_path(self, template):
+        'file name template for stills, see writer.ImageWriter'
+        self._save_path = template
+        if self._writer:
+            self._writer.template = template
+
+    def set_encoder(self, ext, encoder):
+        'encoder(data, path) writes the stills saved to files ending with ext'
+        self._encoders[ext] = encoder
+        if self._writer:
+            self._writer.set_encoder(ext, encoder)
+
+    def flush_saves(self, timeout=None):
+        'wait until every snapped still is on disk. return False on timeout'
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._snap_cond:
+            # stills are queued for the writer only when they arrive
+            if not self._snap_cond.wait_for(lambda: not self._snap_paths, timeout):
+                return False
+
+        if self._writer:
+            if deadline is not None:
+                timeout = max(0, deadline - time.monotonic())
+            return self._writer.flush(timeout)
+        return True
+
+    def get_rgb_data(self, data=None, out=None, bgr=False):
+        """
+            return the frame as a (h, w, 3) uint8 array in RGB order,
+            or BGR order if bgr is True. out is an optional destination array
+        """
         if data is None:
-            data = self._data
+            return self._with_latest(lambda d: self.get_rgb_data(d, out, bgr))
 
-        raw = data.view(np.uint8).reshape(data.shape + (-1,))
-        bgr = raw[..., :3]
-        image = PIL.Image.fromarray(bgr, 'RGB')
-        b, g, r = image.split()
-        return PIL.Image.merge('RGB', (r, g, b))
+        data = self._soft_process(data)
+        if bgr:
+            return convert.to_bgr(data, out)
+        return convert.to_rgb(data, out)
 
     def get_image_data(self):
-        d = self._data
-        return d
+        """
+            return a copy of the most recent frame, use get_latest_frame to
+            read it without a copy
+        """
+        return self._with_latest(lambda data: np.array(self._soft_process(data)))
+
+    # region of interest
+    def set_roi(self, x, y, w, h, hardware=True):
+        """
+            only capture the w x h region at x, y of the current resolution.
+
+            with hardware=True the camera crops with Toupcam_put_Roi, offsets
+            and sizes are rounded down to even numbers and must be at least 16.
+            The frame buffers are reallocated at the region size, leases of
+            full size frames stay valid. Frames of a running capture have the
+            new size shortly after.
+
+            if the camera refuses the region or hardware is False frames stay
+            full size and get_image_data, get_pil_image and get_rgb_data crop
+            them before converting. return True if the camera crops
+        """
+        if hardware:
+            roi = tuple(int(v) & ~1 for v in (x, y, w, h))
+            if self._lib_func('put_Roi', *roi):
+                self._soft_roi = None
+                self._hw_roi = roi
+                self._reallocate()
+                return True
+
+        if self._hw_roi:
+            # the software region is of the full frame
+            self.clear_roi()
+        self._soft_roi = (x, y, w, h)
+        return False
+
+    def clear_roi(self):
+        'capture the full frame again'
+        self._soft_roi = None
+        if self._hw_roi:
+            self._hw_roi = None
+            self._lib_func('put_Roi', 0, 0, 0, 0)
+            self._reallocate()
+
+    def get_roi(self):
+        """
+            return (x, y, w, h, hardware) of the current region, None if the
+            full frame is captured
+        """
+        if self._hw_roi:
+            vs = [ctypes.c_uint() for _ in range(4)]
+            if self._lib_func('get_Roi', *[ctypes.byref(v) for v in vs]):
+                return tuple(v.value for v in vs) + (True,)
+            return self._hw_roi + (True,)
+        elif self._soft_roi:
+            return self._soft_roi + (False,)
+
+    # binning
+    def set_binning(self, factor, mode=convert.BIN_AVERAGE, hardware=True):
+        """
+            reduce the live frames by factor in both directions, mode is
+            convert.BIN_AVERAGE, BIN_SUM or BIN_SKIP.
+
+            with hardware=True the camera bins with TOUPCAM_OPTION_BINNING
+            (factor 2-4, average or sum) and the frame buffers are reallocated
+            at the binned size.
+
+            otherwise frames stay full size and get_image_data, get_pil_image
+            and get_rgb_data bin them with convert.bin_pixels, raw Bayer
+            frames colour by colour. Stills are not binned. return True if the
+            camera bins
+        """
+        if mode not in convert.BIN_MODES:
+            raise ValueError('mode must be one of {}'.format(', '.join(convert.BIN_MODES)))
+
+        if factor == 1:
+            self.clear_binning()
+            return True
+
+        if hardware and mode != convert.BIN_SKIP and factor <= 4:
+            value = factor | 0x80 if mode == convert.BIN_AVERAGE else factor
+            if self.set_option(TOUPCAM_OPTION_BINNING, value):
+                self._soft_bin = None
+                self._hw_bin = factor
+                self._reallocate()
+                return True
+
+        if self._hw_bin != 1:
+            self.clear_binning()
+        self._soft_bin = (factor, mode)
+        return False
+
+    def clear_binning(self):
+        self._soft_bin = None
+        if self._hw_bin != 1:
+            self._hw_bin = 1
+            self.set_option(TOUPCAM_OPTION_BINNING, 1)
+            self._reallocate()
+
+    def get_binning(self):
+        'return (factor, mode, hardware), None if frames are not binned'
+        if self._hw_bin != 1:
+            value = self.get_option(TOUPCAM_OPTION_BINNING) or 0
+            mode = convert.BIN_AVERAGE if value & 0x80 else convert.BIN_SUM
+            return value & 0x7f, mode, True
+        elif self._soft_bin:
+            return self._soft_bin + (False,)
+
+    # frame buffer
+    def get_frame_spec(self):
+        """
+            return (shape, dtype, raw format) of the live frames without
+            leasing one, None if the camera is not open
+        """
+        ring = self._ring
+        if ring is not None:
+            return ring.shape, ring.dtype, ring.format
+
+    def get_recording_spec(self, meta=None):
+        """
+            return (shape, dtype, raw format, meta) to size a recorder or
+            publisher for the live frames, meta gets the camera serial.
+            raise IOError if the camera is not open
+        """
+        spec = self.get_frame_spec()
+        if spec is None:
+            raise IOError('Camera is not open')
+
+        meta = dict(meta or {})
+        serial = self.get_serial()
+        if serial:
+            meta.setdefault('serial', serial.decode('ascii', 'ignore'))
+        return spec + (meta,)
+
+    def get_latest_frame(self):
+        """
+            lease the most recent Frame, or None if no frame has arrived.
+            the buffer is not overwritten until the Frame is released
+        """
+        if self._ring:
+            return self._ring.latest()
+
+    def get_next_frame(self, timeout=None):
+        'lease the oldest unread Frame, blocking up to timeout seconds'
+        if self._ring:
+            return self._ring.next(timeout)
+
+    def frames(self, timeout=None):
+        """
+            generator of leased Frames in the order they arrive, blocking for
+            each next one. Stops when no frame arrives within timeout or the
+            camera is closed. Frames overwritten before they were read are
+            counted in get_skipped_frames, see pipeline for processing stages:
+
+                for frame in cam.frames(timeout=1):
+                    with frame:
+                        ...
+        """
+        last = None
+        while 1:
+            frame = self.get_next_frame(timeout)
+            if frame is None:
+                return
+
+            if last is not None and frame.seq > last + 1:
+                self._skipped += frame.seq - last - 1
+            last = frame.seq
+            yield frame
+
+    def get_frame(self, seq):
+        """
+            lease the Frame with sequence number seq without marking it read,
+            e.g. from a frame callback. None if it was overwritten
+        """
+        if self._ring:
+            return self._ring.lease(seq)
+
+    def add_frame_callback(self, func):
+        """
+            call func(seq, timestamp) on the worker thread after each frame is
+            written to the buffer ring. keep it short, lease the frame with
+            get_next_frame/get_latest_frame from another thread
+        """
+        self._frame_callbacks.append(func)
+
+    def remove_frame_callback(self, func):
+        self._frame_callbacks.remove(func)
+
+    def get_frame_count(self):
+        if self._ring:
+            return self._ring.count
+
+    def get_dropped_frames(self):
+        if self._ring:
+            return self._ring.dropped
+
+    def get_skipped_frames(self):
+        'frames the frames() generator never yielded because they were overwritten'
+        return self._skipped
+
+    def get_worker_dropped(self):
+        'events discarded because the worker queue was full'
+        if self._worker:
+            return self._worker.dropped
+        return 0
 
     def cam_close(self):
+        # drain the worker while the handle is still valid
+        if self._worker:
+            self._worker.stop()
+            self._worker = None
+
+        self._fail_triggers(IOError('Camera closed'))
+        with self._snap_cond:
+            # their stills will not arrive
+            items, self._snap_paths = self._snap_paths, deque()
+            self._snap_cond.notify_all()
+        for _, future in items:
+            future.set_exception(IOError('Camera closed'))
+
         if self.cam:
             lib.Toupcam_Close(self.cam)
 
-    def cam_open(self):
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    def cam_open(self, policy=DROP_OLDEST, queue_size=8):
+        """
+            start pull mode. Frames are pulled on a worker thread, policy
+            (drop_oldest, drop_newest or block) decides what happens when
+            more than queue_size image events are waiting, stills and setting
+            changes are never dropped
+        """
         self.set_esize(self.resolution)
-        args = self.get_size()
-        if not args:
+        if not self._reallocate():
             return
 
-        h, w = args[1].value, args[0].value
-
-        shape = (h, w)
-        if self.bits == 8:
-            dtype = np.uint8
-        else:
-            dtype = np.uint32
+        self._read_exposure()
+        self._read_temptint()
 
-        self._data = np.zeros(shape, dtype=dtype)
+        serial = self.get_serial() or b''
+        self._writer = ImageWriter(self._save_path, serial=serial.decode('ascii', 'ignore'))
+        for ext, encoder in self._encoders.items():
+            self._writer.set_encoder(ext, encoder)
 
         bits = ctypes.c_int(self.bits)
 
-        def get_frame(nEvent, ctx):
+        def handle_event(nEvent, timestamp):
+            'runs on the worker thread'
             if nEvent == TOUPCAM_EVENT_IMAGE:
                 w, h = ctypes.c_uint(), ctypes.c_uint()
 
-                lib.Toupcam_PullImage(self.cam, ctypes.c_void_p(self._data.ctypes.data), bits,
-                                      ctypes.byref(w),
-                                      ctypes.byref(h))
+                with self._pull_lock:
+                    ring = self._ring
+                    slot, buf = ring.begin_write()
+                    if slot is None:
+                        # every buffer is leased by a consumer
+                        self._resolve_trigger(None, 'every frame buffer is leased')
+                        return
+
+                    result = lib.Toupcam_PullImageWithRowPitch(self.cam, ctypes.c_void_p(buf.ctypes.data), bits,
+                                                               self._pitch,
+                                                               ctypes.byref(w),
+                                                               ctypes.byref(h))
+                    if not success(result):
+                        ring.abort(slot)
+                        self._resolve_trigger(None, 'pull failed')
+                        return
+
+                    if (h.value, w.value) != ring.shape[:2]:
+                        # pulled before a new region took effect
+                        ring.abort(slot)
+                        self._resolve_trigger(None, 'region changed')
+                        return
+
+                    meta = (w.value, h.value) + self._exposure + self._temptint + (self.resolution, self._hw_roi)
+                    seq = ring.commit(slot, timestamp, meta)
+                    self._resolve_trigger(seq, None)
+
+                for func in self._frame_callbacks:
+                    func(seq, timestamp)
+
+            elif nEvent == TOUPCAM_EVENT_EXPOSURE:
+                # frames pulled after this event carry the new values
+                self._read_exposure()
+
+            elif nEvent == TOUPCAM_EVENT_TEMPTINT:
+                self._read_temptint()
 
             elif nEvent == TOUPCAM_EVENT_STILLIMAGE:
-                w, h = self.get_size()
-                h, w = h.value, w.value
+                burst = self._burst
+                if burst is not None and not burst.is_done():
+                    try:
+                        if self._pull_still(bits, burst.next_buffer()) is not None:
+                            burst.commit(timestamp)
+                        else:
+                            burst.cancel('pull failed')
+                    except ValueError as e:
+                        burst.cancel(str(e))
+
+                    if burst.is_done():
+                        self._burst = None
+                    return
+
+                self._do_save(self._pull_still(bits))
+
+        # only live images may be dropped, stills and setting changes may not
+        self._worker = worker = EventWorker(handle_event, queue_size, policy,
+                                            droppable=lambda event: event == TOUPCAM_EVENT_IMAGE)
+        worker.start()
 
-                still = np.zeros((h, w), dtype=np.uint32)
-                lib.Toupcam_PullStillImage(self.cam, ctypes.c_void_p(
-                    still.ctypes.data), bits, None, None)
-                self._do_save(still)
+        def get_frame(nEvent, ctx):
+            'SDK callback, only hands the event to the worker'
+            worker.post(nEvent)
 
-        callback = ctypes.CFUNCTYPE(None, ctypes.c_uint, ctypes.c_void_p)
-        self._frame_fn = callback(get_frame)
+        self._frame_fn = EVENT_CALLBACK(get_frame)
 
         result = lib.Toupcam_StartPullModeWithCallback(
-            self.cam, self._frame_fn)
+            self.cam, self._frame_fn, None)
+        if not success(result):
+            worker.stop()
+            self._worker = None
+            self._writer.close()
+            self._writer = None
 
         return success(result)
 
+    def trigger(self):
+        """
+            return a concurrent.futures.Future resolved with the leased Frame
+            of the next image. In software trigger mode a trigger is fired,
+            in external trigger mode the future waits for the hardware trigger:
+
+                cam.set_trigger_mode(TRIGGER_SOFTWARE)
+                with cam.trigger().result(timeout=1) as frame:
+                    inspect(frame.data)
+
+            the time from trigger() to the frame is recorded in
+            trigger_latency. Images arriving while no trigger is pending only
+            go to the frame buffer
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        item = (future, time.monotonic())
+        with self._trigger_lock:
+            self._triggers.append(item)
+
+        if self._trigger_mode != TRIGGER_EXTERNAL and not self.software_trigger(1):
+            with self._trigger_lock:
+                self._triggers.remove(item)
+            future.set_exception(IOError('Toupcam_Trigger failed'))
+        return future
+
+    def pending_triggers(self):
+        return len(self._triggers)
+
     # private
+    def _frame_layout(self, w, h):
+        return frame_layout(self.bits, w, h)
+
+    def _frame_size(self):
+        'size of the pulled frames after the camera crops and bins'
+        if self._hw_roi:
+            w, h = self._hw_roi[2:]
+        else:
+            args = self.get_size()
+            if not args:
+                return
+            w, h = args[0].value, args[1].value
+
+        return w // self._hw_bin, h // self._hw_bin
+
+    def _reallocate(self):
+        'allocate the frame buffers for the current frame size'
+        size = self._frame_size()
+        if not size:
+            return False
+
+        w, h = size
+        shape, dtype, pitch = self._frame_layout(w, h)
+        with self._pull_lock:
+            ring = self._ring
+            if ring is None or ring.shape != shape or ring.dtype != dtype:
+                self._ring = FrameRing(shape, dtype, self.nbuffers, self.frame_format)
+                if ring is not None:
+                    # keep the statistics across regions
+                    self._ring.count = ring.count
+                    self._ring.dropped = ring.dropped
+            self._ring.format = self.frame_format
+            self._pitch = ctypes.c_int(pitch)
+        return True
+
+    def _snap(self, path):
+        'return (Toupcam_Snap result, Future of the written file name)'
+        future = Future()
+        future.set_running_or_notify_cancel()
+        item = (path, future)
+        with self._snap_cond:
+            self._snap_paths.append(item)
+
+        ok = self._lib_func('Snap', self.resolution)
+        if not ok:
+            with self._snap_cond:
+                self._snap_paths.remove(item)
+                self._snap_cond.notify_all()
+            future.set_exception(IOError('Toupcam_Snap failed'))
+        return ok, future
+
+    def _with_latest(self, func):
+        'return func(data) of the most recent frame, the frame is leased while func runs'
+        frame = self.get_latest_frame()
+        if frame is not None:
+            with frame:
+                return func(frame.data)
+
+    def _soft_process(self, data):
+        'apply the software region and binning to a full size frame'
+        roi, binning = self._soft_roi, self._soft_bin
+        if data is None or not (roi or binning):
+            return data
+
+        ring = self._ring
+        if ring is not None and data.shape[:2] != ring.shape[:2]:
+            # already processed
+            return data
+
+        fmt = self.frame_format
+        bayer = fmt is not None and fmt.is_bayer()
+        if roi:
+            x, y, w, h = roi
+            if bayer:
+                # keep the colour pattern of the mosaic
+                x, y = x & ~1, y & ~1
+            data = data[y:y + h, x:x + w]
+        if binning:
+            data = convert.bin_pixels(data, *binning, bayer=bayer,
+                                      max_value=fmt.max_value if fmt is not None else None)
+        return data
+
+    def _read_exposure(self):
+        self._exposure = (self.get_exposure_time(), self.get_analog_gain())
+
+    def _read_temptint(self):
+        self._temptint = self.get_temperature_tint() or (None, None)
+
+    def _resolve_trigger(self, seq, error):
+        'complete the oldest pending trigger future, runs on the worker thread'
+        if not self._triggers:
+            return
+
+        with self._trigger_lock:
+            if not self._triggers:
+                return
+            future, st = self._triggers.popleft()
+
+        if error:
+            future.set_exception(IOError('Triggered frame lost, {}'.format(error)))
+            return
+
+        frame = self._ring.lease(seq)
+        if frame is None:
+            future.set_exception(IOError('Triggered frame lost, overwritten'))
+            return
+
+        self.trigger_latency.record(time.monotonic() - st)
+        future.set_result(frame)
+
+    def _fail_triggers(self, exc):
+        with self._trigger_lock:
+            items, self._triggers = self._triggers, deque()
+
+        for future, _ in items:
+            future.set_exception(exc)
+
+    def _still_size(self):
+        '(w, h) of the stills at the current resolution'
+        w, h = ctypes.c_int(), ctypes.c_int()
+        if 'get_Resolution' in self._funcs and \
+                self._lib_func('get_Resolution', self.resolution, ctypes.byref(w), ctypes.byref(h)):
+            return w.value, h.value
+
+        size = self.get_size()
+        if size:
+            return size[0].value, size[1].value
+
+    def _pull_still(self, bits, out=None):
+        """
+            peek the still size, then pull it into out or a new buffer.
+            raise ValueError if the still does not fit out
+        """
+        w, h = ctypes.c_uint(), ctypes.c_uint()
+        if not success(lib.Toupcam_PullStillImageWithRowPitch(self.cam, None, bits, 0,
+                                                               ctypes.byref(w), ctypes.byref(h))):
+            return
+
+        shape, dtype, pitch = self._frame_layout(w.value, h.value)
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif out.shape != shape:
+            raise ValueError('still is {}x{}, expected {}'.format(w.value, h.value, out.shape))
+
+        if success(lib.Toupcam_PullStillImageWithRowPitch(self.cam, ctypes.c_void_p(out.ctypes.data), bits,
+                                                          ctypes.c_int(pitch), None, None)):
+            return out
+
     def _do_save(self, im):
-        image = self.get_pil_image(im)
-        image.save(self._save_path)
+        'queue a still for the writer, im is None if the pull failed'
+        with self._snap_cond:
+            path, future = self._snap_paths.popleft() if self._snap_paths else (None, None)
+            try:
+                if im is None:
+                    raise IOError('Failed to pull still')
+                self._writer.submit(im, path, future)
+            except (IOError, ValueError) as e:
+                if future is None:
+                    print('Failed to save still: {}'.format(e))
+                else:
+                    future.set_exception(e)
+            finally:
+                self._snap_cond.notify_all()
 
     # ToupCam interface
-    def _lib_func(self, func, *args, **kw):
-        ff = getattr(lib, 'Toupcam_{}'.format(func))
-        result = ff(self.cam, *args, **kw)
+    def _lib_func(self, func, *args):
+        'call a function of the prototyped table, args are converted by ctypes'
+        result = self._funcs[func](self.cam, *args)
         return success(result)
 
     def _lib_get_func(self, func):
+        'call a get_ function with one out parameter of its declared type'
+        ff = self._funcs[func]
+        v = ff.argtypes[1]._type_()
+        if success(ff(self.cam, ctypes.byref(v))):
+            return v.value
+
+    def set_option(self, option, v):
+        'Toupcam_put_Option, see the TOUPCAM_OPTION_ constants in core'
+        return self._lib_func('put_Option', option, v)
+
+    def get_option(self, option):
         v = ctypes.c_int()
-        if self._lib_func('get_{}'.format(func), ctypes.byref(v)):
+        if self._lib_func('get_Option', option, ctypes.byref(v)):
             return v.value
 
+    # trigger
+    def set_trigger_mode(self, mode):
+        'TRIGGER_VIDEO (free running), TRIGGER_SOFTWARE or TRIGGER_EXTERNAL'
+        if self.set_option(TOUPCAM_OPTION_TRIGGER, mode):
+            self._trigger_mode = mode
+            return True
+        return False
+
+    def get_trigger_mode(self):
+        return self.get_option(TOUPCAM_OPTION_TRIGGER)
+
+    def software_trigger(self, n=1):
+        """
+            capture n frames in software trigger mode.
+            TRIGGER_CONTINUOUS runs until software_trigger(0)
+        """
+        return self._lib_func('Trigger', n)
+
     # setters
     def set_gamma(self, v):
-        self._lib_func('put_Gamma', ctypes.c_int(v))
+        self._lib_func('put_Gamma', v)
 
     def set_contrast(self, v):
-        self._lib_func('put_Contrast', ctypes.c_int(v))
+        self._lib_func('put_Contrast', v)
 
     def set_brightness(self, v):
-        self._lib_func('put_Brightness', ctypes.c_int(v))
+        self._lib_func('put_Brightness', v)
 
     def set_saturation(self, v):
-        self._lib_func('put_Saturation', ctypes.c_int(v))
+        self._lib_func('put_Saturation', v)
 
     def set_hue(self, v):
-        self._lib_func('put_Hue', ctypes.c_int(v))
+        self._lib_func('put_Hue', v)
 
     def set_exposure_time(self, v):
-        self._lib_func('put_ExpoTime', ctypes.c_ulong(v))
+        self._lib_func('put_ExpoTime', v)
+
+    def set_analog_gain(self, v):
+        'analog gain in percent, 100 is 1x'
+        self._lib_func('put_ExpoAGain', v)
 
     # getters
     def get_gamma(self):
-        return self._lib_get_func('Gamma')
+        return self._lib_get_func('get_Gamma')
 
     def get_contrast(self):
-        return self._lib_get_func('Contrast')
+        return self._lib_get_func('get_Contrast')
 
     def get_brightness(self):
-        return self._lib_get_func('Brightness')
+        return self._lib_get_func('get_Brightness')
 
     def get_saturation(self):
-        return self._lib_get_func('Saturation')
+        return self._lib_get_func('get_Saturation')
 
     def get_hue(self):
-        return self._lib_get_func('Hue')
+        return self._lib_get_func('get_Hue')
 
     def get_exposure_time(self):
-        return self._lib_get_func('ExpoTime')
+        return self._lib_get_func('get_ExpoTime')
+
+    def get_analog_gain(self):
+        return self._lib_get_func('get_ExpoAGain')
 
     def do_awb(self, callback=None):
         """
@@ -305,17 +843,16 @@ class ToupCamCamera(object):
         :return:
         """
 
-        def temptint_cb(temp, tint):
+        def temptint_cb(temp, tint, ctx):
             if callback:
                 callback((temp, tint))
 
-        callback = ctypes.CFUNCTYPE(None, ctypes.c_uint, ctypes.c_void_p)
-        self._temptint_cb = callback(temptint_cb)
+        self._temptint_cb = TEMPTINT_CALLBACK(temptint_cb)
 
-        return self._lib_func('AwbOnePush', self._temptint_cb)
+        return self._lib_func('AwbOnePush', self._temptint_cb, None)
 
     def set_temperature_tint(self, temp, tint):
-        lib.Toupcam_put_TempTint(self.cam, temp, tint)
+        self._lib_func('put_TempTint', temp, tint)
 
     def get_temperature_tint(self):
         temp = ctypes.c_int()
@@ -324,19 +861,15 @@ class ToupCamCamera(object):
             return temp.value, tint.value
 
     def get_auto_exposure(self):
-        expo_enabled = ctypes.c_bool()
-        result = lib.Toupcam_get_AutoExpoEnable(
-            self.cam, ctypes.byref(expo_enabled))
-        if success(result):
-            return expo_enabled.value
+        expo_enabled = self._lib_get_func('get_AutoExpoEnable')
+        if expo_enabled is not None:
+            return bool(expo_enabled)
 
     def set_auto_exposure(self, expo_enabled):
-        lib.Toupcam_put_AutoExpoEnable(self.cam, expo_enabled)
+        self._lib_func('put_AutoExpoEnable', int(expo_enabled))
 
     def get_camera(self, cid=None):
-        func = lib.Toupcam_Open
-        func.restype = ctypes.POINTER(HToupCam)
-        return func(cid)
+        return lib.Toupcam_Open(cid)
 
     def get_serial(self):
         sn = ctypes.create_string_buffer(32)
@@ -358,7 +891,7 @@ class ToupCamCamera(object):
             return hw.value
 
     def get_size(self):
-        w, h = ctypes.c_long(), ctypes.c_long()
+        w, h = ctypes.c_int(), ctypes.c_int()
 
         result = lib.Toupcam_get_Size(
             self.cam, ctypes.byref(w), ctypes.byref(h))
@@ -366,17 +899,129 @@ class ToupCamCamera(object):
             return w, h
 
     def get_esize(self):
-        res = ctypes.c_long()
+        res = ctypes.c_uint()
         result = lib.Toupcam_get_eSize(self.cam, ctypes.byref(res))
         if success(result):
             return res
 
     def set_esize(self, nres):
-        lib.Toupcam_put_eSize(self.cam, ctypes.c_ulong(nres))
+        """
+            switch to resolution index nres. the hardware region is applied
+            again, or dropped if it does not fit, and the frame buffers of an
+            open camera are reallocated. return True on success
+        """
+        if not success(lib.Toupcam_put_eSize(self.cam, nres)):
+            return False
+
+        self.resolution = nres
+        if self._hw_roi and not self._lib_func('put_Roi', *self._hw_roi):
+            # changing the resolution resets the region
+            print('Region {} does not fit resolution {}, capturing the full frame'.format(self._hw_roi, nres))
+            self._hw_roi = None
+
+        if self._ring is not None:
+            self._reallocate()
+        return True
+
+
+class ToupCamCameraRaw(ToupCamCamera):
+    """
+        raw Bayer (or monochrome) frames straight from the sensor.
+
+        frames and stills are (h, w) arrays, uint8 for 8 bit data and uint16
+        for deeper data. frame.format (and get_raw_format) is a
+        raw.RawFormat with the FourCC pattern and the bit depth.
+
+        bitdepth is 8 or 'max' for the deepest depth of the sensor
+        (TOUPCAM_OPTION_BITDEPTH), None keeps the camera setting.
+        get_rgb_data and get_pil_image demosaic with demosaic_method, set it
+        to None to get the mosaic as a gray image
+    """
+    _save_path = 'still_{serial}_{seq:05d}.npy'
+    demosaic_method = demosaic.BILINEAR
+
+    def __init__(self, resolution=2, bitdepth='max', nbuffers=4, cid=None):
+        super(ToupCamCameraRaw, self).__init__(resolution, 8, nbuffers, cid)
+        self.bitdepth = bitdepth
+
+    def cam_open(self, policy=DROP_OLDEST, queue_size=8):
+        """
+            switch to raw output, then start pull mode. The raw option can only
+            be changed while the camera is stopped
+        """
+        if not self.set_option(TOUPCAM_OPTION_RAW, 1):
+            print('Failed to set raw mode')
+            return False
+
+        if self.bitdepth is not None:
+            self.set_option(TOUPCAM_OPTION_BITDEPTH, 0 if self.bitdepth == 8 else 1)
+
+        self.frame_format = self.get_raw_format()
+        if self.frame_format is None:
+            print('Failed to get the raw format')
+            return False
+
+        return super(ToupCamCameraRaw, self).cam_open(policy, queue_size)
+
+    def get_raw_format(self):
+        'return the raw.RawFormat of the frames'
+        fourcc, bits = ctypes.c_uint(0), ctypes.c_uint(0)
+        if not self._lib_func('get_RawFormat', ctypes.byref(fourcc), ctypes.byref(bits)):
+            return
+
+        # with TOUPCAM_OPTION_BITDEPTH off the data is 8 bits whatever the sensor
+        data_bits = bits.value if self.get_option(TOUPCAM_OPTION_BITDEPTH) else 8
+        return RawFormat(fourcc.value, data_bits, bits.value)
+
+    def get_pil_image(self, data=None):
+        """
+            the demosaiced RGB image, or the mosaic as a gray image if
+            demosaic_method is None. 16 bit gray data is scaled to the full
+            16 bit range
+        """
+        if data is None:
+            return self._with_latest(self.get_pil_image)
+
+        data = self._soft_process(data)
+        fmt = self.frame_format
+        if self.demosaic_method and fmt.is_bayer():
+            return convert.to_pil_image(self.get_rgb_data(data, bgr=True))
+
+        if data.dtype == np.uint16 and fmt.bits < 16:
+            data = data << (16 - fmt.bits)
+        return convert.to_pil_image(data)
+
+    def get_rgb_data(self, data=None, out=None, bgr=False, method=None):
+        """
+            demosaic the frame to a (h, w, 3) uint8 array in RGB order, or BGR
+            order if bgr is True. method defaults to demosaic_method, use
+            demosaic.demosaic directly to keep the full bit depth
+        """
+        if data is None:
+            return self._with_latest(lambda d: self.get_rgb_data(d, out, bgr, method))
+
+        data = self._soft_process(data)
+        fmt = self.frame_format
+        rgb = demosaic.demosaic(data, fmt.pattern, method or self.demosaic_method or demosaic.BILINEAR,
+                                max_value=fmt.max_value)
+        if rgb.dtype != np.uint8:
+            rgb >>= fmt.bits - 8
+            rgb = rgb.astype(np.uint8)
+        if bgr:
+            rgb = rgb[..., ::-1]
+
+        if out is None:
+            return rgb
+        out[...] = rgb
+        return out
+
+    # private
+    def _frame_layout(self, w, h):
+        dtype = self.frame_format.dtype if self.frame_format else np.dtype(np.uint8)
+        return (h, w), dtype.type, w * dtype.itemsize
 
 
 if __name__ == '__main__':
-    import time
     cam = ToupCamCameraRaw()
     cam.cam_open()
     time.sleep(1)
@@ -0,0 +1,183 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Conversion of pulled frames to RGB/BGR arrays and PIL images.
+
+The SDK delivers color frames in BGR byte order, either packed (RGB24, a
+(h, w, 3) uint8 array) or padded to 32 bits per pixel (RGB32, stored here as
+a (h, w) uint32 array). 8 bit gray frames are (h, w) uint8 arrays.
+Conversions write straight into the destination, no intermediate copies.
+"""
+# ============= standard library imports ========================
+import numpy as np
+# ============= local library imports  ==========================
+
+
+def is_gray(data):
+    return data.ndim == 2 and data.dtype == np.uint8
+
+
+def bgr_view(data):
+    """
+        return a (h, w, 3) or (h, w, 4) uint8 view of a BGR(X) frame,
+        or a (h, w, 1) view of a gray frame
+    """
+    if data.dtype == np.uint32:
+        # through a length 1 axis so strided views (crops, skips) work too
+        return data[..., np.newaxis].view(np.uint8)
+    elif data.ndim == 2:
+        return data[..., np.newaxis]
+    return data
+
+
+def to_rgb(data, out=None):
+    """
+        convert a BGR(X) frame to a (h, w, 3) RGB array
+    """
+    return _copy_channels(bgr_view(data), (2, 1, 0), out)
+
+
+def to_bgr(data, out=None):
+    """
+        drop the padding byte of a BGRX frame, (h, w, 3) BGR array
+    """
+    return _copy_channels(bgr_view(data), (0, 1, 2), out)
+
+
+def to_pil_image(data):
+    """
+        build an RGB PIL image from a BGR(X) frame, an L image from a gray
+        frame or an I;16 image from a 16 bit gray (or raw) frame.
+
+        PIL's raw decoder swaps the channels while it copies the buffer so
+        no intermediate array is created
+    """
+    # PIL is only imported by the consumers that need images
+    from PIL import Image
+
+    if is_gray(data):
+        h, w = data.shape
+        return Image.frombytes('L', (w, h), np.ascontiguousarray(data))
+    elif data.dtype == np.uint16:
+        h, w = data.shape
+        # frombytes, frombuffer would share the frame buffer
+        return Image.frombytes('I;16', (w, h), np.ascontiguousarray(data))
+
+    if not data.flags.c_contiguous:
+        # copy whole pixels, much faster than copying the bytes of a view
+        data = np.ascontiguousarray(data)
+
+    bgr = bgr_view(data)
+    h, w, c = bgr.shape
+
+    rawmode = 'BGRX' if c == 4 else 'BGR'
+    return Image.frombuffer('RGB', (w, h), bgr, 'raw', rawmode, 0, 1)
+
+
+BIN_AVERAGE = 'average'
+BIN_SUM = 'sum'
+BIN_SKIP = 'skip'
+
+BIN_MODES = (BIN_AVERAGE, BIN_SUM, BIN_SKIP)
+
+
+def bin_pixels(data, factor, mode=BIN_AVERAGE, bayer=False, max_value=None):
+    """
+        reduce a frame by factor in both directions, keeping its layout
+        (gray, BGR or BGRX) and dtype.
+
+            average: mean of each factor x factor block
+            sum: saturating sum of each block, brightens dim scenes
+            skip: every factor-th pixel, a view without any copy
+
+        with bayer=True data is a 2x2 colour mosaic and each colour is binned
+        on its own, the result is a mosaic with the same pattern.
+        max_value is where sums saturate, the largest value of the dtype by
+        default, e.g. 4095 for 12 bit data in uint16.
+
+        rows and columns that do not fill a whole block are dropped
+    """
+    if mode not in BIN_MODES:
+        raise ValueError('mode must be one of {}'.format(', '.join(BIN_MODES)))
+
+    if factor == 1:
+        return data
+    if bayer:
+        return _bin_bayer(data, factor, mode, max_value)
+    if mode == BIN_SKIP:
+        return data[::factor, ::factor]
+
+    src = bgr_view(data)
+    h, w, c = src.shape
+    bh, bw = h // factor, w // factor
+    src = src[:bh * factor, :bw * factor]
+
+    if max_value is None:
+        max_value = np.iinfo(src.dtype).max
+    n = factor * factor
+    # the narrowest type that holds the sum of a block
+    acc = np.uint16 if n * max_value <= 0xffff else np.uint32 if n * max_value <= 0xffffffff else np.uint64
+
+    # add the rows of each block, then the columns. factor strided adds
+    # are several times faster than reshape(...).sum(axis=(1, 3))
+    rows = src[0::factor].astype(acc)
+    for i in range(1, factor):
+        rows += src[i::factor]
+    total = rows[:, 0::factor].copy()
+    for i in range(1, factor):
+        total += rows[:, i::factor]
+
+    if mode == BIN_SUM:
+        out = np.minimum(total, max_value).astype(src.dtype)
+    else:
+        total += n // 2
+        out = (total // n).astype(src.dtype)
+
+    if data.dtype == np.uint32:
+        return out.view(np.uint32).reshape(bh, bw)
+    elif data.ndim == 2:
+        return out[..., 0]
+    return out
+
+
+def _bin_bayer(data, factor, mode, max_value):
+    'bin the four colour planes of a 2x2 mosaic separately and interleave them again'
+    h, w = data.shape[:2]
+    bh, bw = h // (2 * factor), w // (2 * factor)
+    out = np.empty((2 * bh, 2 * bw), dtype=data.dtype)
+    for dy in (0, 1):
+        for dx in (0, 1):
+            plane = data[dy::2, dx::2]
+            out[dy::2, dx::2] = bin_pixels(plane, factor, mode, max_value=max_value)[:bh, :bw]
+    return out
+
+
+def _copy_channels(src, order, out):
+    if out is None:
+        out = np.empty(src.shape[:2] + (3,), dtype=np.uint8)
+
+    if src.shape[2] == 1:
+        # gray
+        order = (0, 0, 0)
+
+    # one strided copy per channel is several times faster than a single
+    # copy from a (h, w, 3) view with a channel stride of -1 or 4
+    for i, c in enumerate(order):
+        out[..., i] = src[..., c]
+    return out
+
+# ============= EOF =============================================
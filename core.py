@@ -19,6 +19,7 @@
 import ctypes
 import os
 import sys
+import threading
 # ============= local library imports  ==========================
 
 TOUPCAM_EVENT_EXPOSURE = 1  # exposure time changed
@@ -29,22 +30,238 @@ TOUPCAM_EVENT_STILLIMAGE = 5  # snap (still) frame arrived, use Toupcam_PullStil
 TOUPCAM_EVENT_ERROR = 80  # something error happens
 TOUPCAM_EVENT_DISCONNECTED = 81  # camera disconnected
 
+# Toupcam_put_Option/Toupcam_get_Option
+TOUPCAM_OPTION_RAW = 0x04  # raw mode, read the sensor data. This option can only be changed before Toupcam_StartXXXX
+TOUPCAM_OPTION_BITDEPTH = 0x06  # 0 = 8 bits mode, 1 = 16 bits mode
+TOUPCAM_OPTION_TRIGGER = 0x0b  # 0 = video mode, 1 = software or simulated trigger mode, 2 = external trigger mode
+TOUPCAM_OPTION_BINNING = 0x17  # 0x01 = no binning, n = saturating add n*n, 0x8n = average n*n
+
 root = os.path.dirname(__file__)
-if sys.platform == 'darwin':
-    lib = ctypes.cdll.LoadLibrary(os.path.join(root, 'osx', 'libtoupcam.dylib'))
+
+
+TOUPCAM_MAX = 16
+
+
+class HToupCam(ctypes.Structure):
+    _fields_ = [('unused', ctypes.c_int)]
+
+
+# camera ids and names are wide strings on windows
+ID_TYPE = ctypes.c_wchar_p if sys.platform == 'win32' else ctypes.c_char_p
+_CHAR = ctypes.c_wchar if sys.platform == 'win32' else ctypes.c_char
+
+
+class ToupcamModel(ctypes.Structure):
+    # only the leading name field, the rest of the layout differs between
+    # ToupcamModel and ToupcamModelV2 and between SDK versions
+    _fields_ = [('name', ID_TYPE)]
+
+
+class ToupcamInst(ctypes.Structure):
+    # ToupcamInst and ToupcamInstV2 share this layout
+    _fields_ = [('displayname', _CHAR * 64),
+                ('id', _CHAR * 64),
+                ('model', ctypes.POINTER(ToupcamModel))]
+
+# callbacks use __stdcall on windows
+if sys.platform == 'win32':
+    CALLBACK_TYPE = ctypes.WINFUNCTYPE
 else:
-    directory = 'x64' if sys.maxsize > 2 ** 32 else 'x84'
-    # ext = 'lib' if sys.platform.startswith('linux') else 'dll'
+    CALLBACK_TYPE = ctypes.CFUNCTYPE
+
+# void (*PTOUPCAM_EVENT_CALLBACK)(unsigned nEvent, void* pCallbackCtx)
+EVENT_CALLBACK = CALLBACK_TYPE(None, ctypes.c_uint, ctypes.c_void_p)
+# void (*PITOUPCAM_TEMPTINT_CALLBACK)(const int nTemp, const int nTint, void* pCtx)
+TEMPTINT_CALLBACK = CALLBACK_TYPE(None, ctypes.c_int, ctypes.c_int, ctypes.c_void_p)
+
+_H = ctypes.POINTER(HToupCam)
+_HRESULT = ctypes.c_int
+_PINT = ctypes.POINTER(ctypes.c_int)
+_PUINT = ctypes.POINTER(ctypes.c_uint)
+
+
+def _int_property(ctype=ctypes.c_int):
+    return {'put': (_HRESULT, [_H, ctype]),
+            'get': (_HRESULT, [_H, ctypes.POINTER(ctype)])}
+
+
+# name: (restype, argtypes), applied once when the function is first used
+PROTOTYPES = {'Enum': (ctypes.c_uint, [ctypes.POINTER(ToupcamInst)]),
+              'EnumV2': (ctypes.c_uint, [ctypes.POINTER(ToupcamInst)]),
+              'Open': (_H, [ID_TYPE]),
+              'Close': (None, [_H]),
+              'StartPullModeWithCallback': (_HRESULT, [_H, EVENT_CALLBACK, ctypes.c_void_p]),
+              'Stop': (_HRESULT, [_H]),
+
+              'PullImage': (_HRESULT, [_H, ctypes.c_void_p, ctypes.c_int, _PUINT, _PUINT]),
+              'PullImageWithRowPitch': (_HRESULT, [_H, ctypes.c_void_p, ctypes.c_int, ctypes.c_int,
+                                                   _PUINT, _PUINT]),
+              'PullStillImage': (_HRESULT, [_H, ctypes.c_void_p, ctypes.c_int, _PUINT, _PUINT]),
+              'PullStillImageWithRowPitch': (_HRESULT, [_H, ctypes.c_void_p, ctypes.c_int, ctypes.c_int,
+                                                        _PUINT, _PUINT]),
+              'Snap': (_HRESULT, [_H, ctypes.c_uint]),
+              'SnapN': (_HRESULT, [_H, ctypes.c_uint, ctypes.c_uint]),
+
+              'put_Size': (_HRESULT, [_H, ctypes.c_int, ctypes.c_int]),
+              'get_Size': (_HRESULT, [_H, _PINT, _PINT]),
+              'put_eSize': (_HRESULT, [_H, ctypes.c_uint]),
+              'get_eSize': (_HRESULT, [_H, _PUINT]),
+              'get_Resolution': (_HRESULT, [_H, ctypes.c_uint, _PINT, _PINT]),
+              'get_RawFormat': (_HRESULT, [_H, _PUINT, _PUINT]),
+
+              'put_Roi': (_HRESULT, [_H, ctypes.c_uint, ctypes.c_uint, ctypes.c_uint, ctypes.c_uint]),
+              'get_Roi': (_HRESULT, [_H, _PUINT, _PUINT, _PUINT, _PUINT]),
+
+              'put_Option': (_HRESULT, [_H, ctypes.c_uint, ctypes.c_int]),
+              'get_Option': (_HRESULT, [_H, ctypes.c_uint, _PINT]),
+              'Trigger': (_HRESULT, [_H, ctypes.c_ushort]),
+
+              'put_TempTint': (_HRESULT, [_H, ctypes.c_int, ctypes.c_int]),
+              'get_TempTint': (_HRESULT, [_H, _PINT, _PINT]),
+              'AwbOnePush': (_HRESULT, [_H, TEMPTINT_CALLBACK, ctypes.c_void_p]),
+
+              'get_SerialNumber': (_HRESULT, [_H, ctypes.c_char_p]),
+              'get_FwVersion': (_HRESULT, [_H, ctypes.c_char_p]),
+              'get_HwVersion': (_HRESULT, [_H, ctypes.c_char_p])}
+
+for _name, _ctype in (('Gamma', ctypes.c_int),
+                      ('Contrast', ctypes.c_int),
+                      ('Brightness', ctypes.c_int),
+                      ('Saturation', ctypes.c_int),
+                      ('Hue', ctypes.c_int),
+                      ('ExpoTime', ctypes.c_uint),
+                      ('ExpoAGain', ctypes.c_ushort),
+                      ('AutoExpoEnable', ctypes.c_int)):
+    for _k, _v in _int_property(_ctype).items():
+        PROTOTYPES['{}_{}'.format(_k, _name)] = _v
+
+
+def default_library_path():
+    'path of the libtoupcam bundled for this platform'
+    if sys.platform == 'darwin':
+        return os.path.join(root, 'osx', 'libtoupcam.dylib')
+
+    directory = 'x64' if sys.maxsize > 2 ** 32 else 'x86'
     if sys.platform.startswith('linux'):
-        name = 'libtoupcam.so'
-        lib = ctypes.cdll.LoadLibrary(os.path.join(root, directory, name))
+        return os.path.join(root, directory, 'libtoupcam.so')
     else:
-        name = 'toupcam.dll'
-        lib = ctypes.windll.LoadLibrary(os.path.join(root, directory, name))
+        return os.path.join(root, directory, 'toupcam.dll')
 
 
-class HToupCam(ctypes.Structure):
-    _fields_ = [('unused', ctypes.c_int)]
+def load_native_library(path=None):
+    """
+        load libtoupcam. path defaults to the TOUPCAM_LIBRARY environment
+        variable, then to the library bundled for this platform
+    """
+    if path is None:
+        path = os.environ.get('TOUPCAM_LIBRARY') or default_library_path()
+
+    if sys.platform == 'win32':
+        return ctypes.windll.LoadLibrary(path)
+    return ctypes.cdll.LoadLibrary(path)
+
+
+def load_library(backend=None, path=None):
+    """
+        return the library that implements the Toupcam_* functions.
+        backend is "native" (default) or "sim" for simulator.SimulatedLibrary,
+        it defaults to the TOUPCAM_BACKEND environment variable
+    """
+    if backend is None:
+        backend = os.environ.get('TOUPCAM_BACKEND', 'native')
+
+    if backend == 'sim':
+        from simulator import SimulatedLibrary
+        return SimulatedLibrary()
+    elif backend == 'native':
+        return load_native_library(path)
+    else:
+        raise ValueError('Unknown toupcam backend "{}"'.format(backend))
+
+
+class Library(object):
+    """
+        lazily loaded handle to the toupcam library.
+
+        Nothing is loaded until the first Toupcam_* function is used. Each
+        function gets its PROTOTYPES entry applied once and is then cached as
+        an attribute, so later lookups are plain attribute access.
+    """
+
+    def __init__(self, backend=None, path=None):
+        self._backend = backend
+        self._path = path
+        self._handle = None
+        self._table = None
+        self._lock = threading.Lock()
+
+    def configure(self, backend=None, path=None):
+        'select the backend or library path, must be called before first use'
+        if self._handle is not None:
+            raise RuntimeError('toupcam library is already loaded')
+        self._backend = backend
+        self._path = path
+
+    def is_loaded(self):
+        return self._handle is not None
+
+    def load(self):
+        if self._handle is None:
+            with self._lock:
+                if self._handle is None:
+                    self._handle = load_library(self._backend, self._path)
+        return self._handle
+
+    def table(self):
+        """
+            return {name: function} for every PROTOTYPES entry the library
+            exports, e.g. table['put_ExpoTime'](h, 100)
+        """
+        if self._table is None:
+            funcs = {}
+            for name in PROTOTYPES:
+                try:
+                    funcs[name] = getattr(self, 'Toupcam_{}'.format(name))
+                except AttributeError:
+                    # not exported by this version of the SDK
+                    pass
+            self._table = funcs
+        return self._table
+
+    def __getattr__(self, name):
+        if not name.startswith('Toupcam_'):
+            raise AttributeError(name)
+
+        func = getattr(self.load(), name)
+        proto = PROTOTYPES.get(name[8:])
+        if proto:
+            func.restype, func.argtypes = proto
+
+        setattr(self, name, func)
+        return func
+
+
+class CameraInfo(object):
+    """
+        a connected camera found by enum_cameras. id is passed to Toupcam_Open
+    """
+
+    def __init__(self, inst):
+        self.id = inst.id
+        self.displayname = inst.displayname
+        self.model = inst.model.contents.name if inst.model else None
+
+    def __repr__(self):
+        return 'CameraInfo({!r}, {!r})'.format(self.displayname, self.id)
+
+
+def enum_cameras():
+    'return a CameraInfo for each connected camera'
+    table = lib.table()
+    func = table.get('EnumV2') or table['Enum']
+    insts = (ToupcamInst * TOUPCAM_MAX)()
+    n = func(insts)
+    return [CameraInfo(insts[i]) for i in range(n)]
 
 
 def success(r):
@@ -55,6 +272,9 @@ def success(r):
     """
     return r == 0
 
+
+lib = Library()
+
 # ============= EOF =============================================
 
 
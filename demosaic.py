@@ -0,0 +1,208 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Bayer demosaicing of raw frames with numpy.
+
+Every method works on the whole frame at once: the mosaic is split into its
+four 2x2 phases with strided slices and each colour is interpolated for all
+pixels of a phase in one expression.
+
+    bilinear: average of the nearest samples of each colour
+    edge: Hamilton-Adams. Green is interpolated along the direction with the
+        smaller gradient and corrected with the laplacian of the centre
+        colour, red and blue are interpolated as differences to green.
+        Fewer zipper and colour fringe artefacts on edges, about 4x slower
+"""
+# ============= standard library imports ========================
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+# ============= local library imports  ==========================
+from raw import BAYER_PATTERNS
+
+BILINEAR = 'bilinear'
+EDGE = 'edge'
+
+METHODS = (BILINEAR, EDGE)
+
+# rows of context each method needs on either side of a pixel
+_HALO = 4
+
+
+def demosaic(mosaic, pattern, method=BILINEAR, out=None, threads=1, max_value=None):
+    """
+        return the (h, w, 3) RGB image of a (h, w) Bayer mosaic.
+
+        pattern is the raw.RawFormat pattern, e.g. 'RGGB'. The image has the
+        dtype of the mosaic. max_value clips the edge method, it defaults to
+        the largest value of the dtype, use RawFormat.max_value for 10-14 bit
+        data. threads > 1 splits the frame into bands processed in parallel,
+        numpy releases the GIL while it computes
+    """
+    if pattern not in BAYER_PATTERNS:
+        raise ValueError('pattern must be one of {}'.format(', '.join(BAYER_PATTERNS)))
+    if method not in METHODS:
+        raise ValueError('method must be one of {}'.format(', '.join(METHODS)))
+
+    h, w = mosaic.shape
+    if h % 2 or w % 2 or h < 4 or w < 4:
+        raise ValueError('mosaic must have an even size of at least 4x4, got {}x{}'.format(w, h))
+
+    if out is None:
+        out = np.empty((h, w, 3), dtype=mosaic.dtype)
+    if max_value is None:
+        max_value = np.iinfo(mosaic.dtype).max if mosaic.dtype.kind in 'ui' else 1.0
+
+    func = _bilinear if method == BILINEAR else _edge
+    if threads <= 1 or h < 8 * threads:
+        func(mosaic, pattern, out, max_value)
+        return out
+
+    # even band edges keep every band on the same bayer phase
+    edges = [(h * i // threads) & ~1 for i in range(threads)] + [h]
+
+    def band(i):
+        y0, y1 = edges[i], edges[i + 1]
+        a, b = max(y0 - _HALO, 0), min(y1 + _HALO, h)
+        tmp = np.empty((b - a, w, 3), dtype=out.dtype)
+        func(mosaic[a:b], pattern, tmp, max_value)
+        out[y0:y1] = tmp[y0 - a:y0 - a + y1 - y0]
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(band, range(threads)))
+    return out
+
+
+def _sites(pattern):
+    'return the (y, x) offsets of red, blue, green on red rows and green on blue rows'
+    ry, rx = divmod(pattern.index('R'), 2)
+    by, bx = divmod(pattern.index('B'), 2)
+    return (ry, rx), (by, bx), (ry, 1 - rx), (by, 1 - bx)
+
+
+class _Planes(object):
+    """
+        strided access to a padded plane. at(p, site, dy, dx) is the
+        (h/2, w/2) array of the pixels at offset (dy, dx) of every pixel of
+        the site phase
+    """
+
+    def __init__(self, shape, pad):
+        self.h2, self.w2 = shape[0] // 2, shape[1] // 2
+        self.pad = pad
+
+    def at(self, p, site, dy=0, dx=0):
+        y = self.pad + site[0] + dy
+        x = self.pad + site[1] + dx
+        return p[y:y + 2 * self.h2:2, x:x + 2 * self.w2:2]
+
+
+def _bilinear(mosaic, pattern, out, max_value):
+    r, b, gr, gb = _sites(pattern)
+    s = _Planes(mosaic.shape, 1)
+    # reflecting the border keeps the bayer phase
+    p = np.pad(mosaic, 1, mode='reflect').astype(np.uint32)
+    at = s.at
+    dt = out.dtype
+
+    def cross(site):
+        return (at(p, site, -1, 0) + at(p, site, 1, 0) + at(p, site, 0, -1) + at(p, site, 0, 1) + 2) >> 2
+
+    def diag(site):
+        return (at(p, site, -1, -1) + at(p, site, -1, 1) + at(p, site, 1, -1) + at(p, site, 1, 1) + 2) >> 2
+
+    def horiz(site):
+        return (at(p, site, 0, -1) + at(p, site, 0, 1) + 1) >> 1
+
+    def vert(site):
+        return (at(p, site, -1, 0) + at(p, site, 1, 0) + 1) >> 1
+
+    for site, rgb in ((r, (None, cross, diag)),
+                      (b, (diag, cross, None)),
+                      (gr, (horiz, None, vert)),
+                      (gb, (vert, None, horiz))):
+        o = out[site[0]::2, site[1]::2]
+        for c, f in enumerate(rgb):
+            o[..., c] = at(p, site) if f is None else f(site).astype(dt)
+
+
+def _edge(mosaic, pattern, out, max_value):
+    r, b, gr, gb = _sites(pattern)
+    s = _Planes(mosaic.shape, 2)
+    at = s.at
+    p = np.pad(mosaic, 2, mode='reflect').astype(np.int32)
+
+    # green at red and blue sites, along the smoother direction
+    g = np.empty(mosaic.shape, dtype=np.int32)
+    g[gr[0]::2, gr[1]::2] = mosaic[gr[0]::2, gr[1]::2]
+    g[gb[0]::2, gb[1]::2] = mosaic[gb[0]::2, gb[1]::2]
+    for site in (r, b):
+        c = at(p, site)
+        left, right = at(p, site, 0, -1), at(p, site, 0, 1)
+        up, down = at(p, site, -1, 0), at(p, site, 1, 0)
+        lap_h = 2 * c - at(p, site, 0, -2) - at(p, site, 0, 2)
+        lap_v = 2 * c - at(p, site, -2, 0) - at(p, site, 2, 0)
+
+        grad_h = np.abs(left - right) + np.abs(lap_h)
+        grad_v = np.abs(up - down) + np.abs(lap_v)
+        # 4x the estimates
+        est_h = 2 * (left + right) + lap_h
+        est_v = 2 * (up + down) + lap_v
+
+        est = np.where(grad_h < grad_v, 2 * est_h, np.where(grad_v < grad_h, 2 * est_v, est_h + est_v))
+        est += 4
+        est >>= 3
+        np.clip(est, 0, max_value, out=est)
+        g[site[0]::2, site[1]::2] = est
+
+    # red and blue minus green, interpolated like bilinear
+    planes = []
+    for site in (r, b):
+        d = np.zeros(mosaic.shape, dtype=np.int32)
+        d[site[0]::2, site[1]::2] = mosaic[site[0]::2, site[1]::2] - g[site[0]::2, site[1]::2]
+        planes.append(np.pad(d, 2, mode='reflect'))
+    dr, db = planes
+
+    # 4x the averages
+    def diag(d, site):
+        return at(d, site, -1, -1) + at(d, site, -1, 1) + at(d, site, 1, -1) + at(d, site, 1, 1)
+
+    def horiz(d, site):
+        return 2 * (at(d, site, 0, -1) + at(d, site, 0, 1))
+
+    def vert(d, site):
+        return 2 * (at(d, site, -1, 0) + at(d, site, 1, 0))
+
+    for site, fr, fb in ((r, None, diag),
+                         (b, diag, None),
+                         (gr, horiz, vert),
+                         (gb, vert, horiz)):
+        o = out[site[0]::2, site[1]::2]
+        gs = g[site[0]::2, site[1]::2]
+        o[..., 1] = gs
+        for c, d, f in ((0, dr, fr), (2, db, fb)):
+            if f is None:
+                o[..., c] = mosaic[site[0]::2, site[1]::2]
+            else:
+                v = f(d, site)
+                v += 2
+                v >>= 2
+                v += gs
+                np.clip(v, 0, max_value, out=v)
+                o[..., c] = v
+
+# ============= EOF =============================================
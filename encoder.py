@@ -0,0 +1,129 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+In memory JPEG encoding of frames, for streaming
+"""
+# ============= standard library imports ========================
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+# ============= local library imports  ==========================
+import convert
+from stats import LatencyHistogram
+
+SUBSAMPLING = {'4:4:4': 0, '4:2:2': 1, '4:2:0': 2}
+
+_local = threading.local()
+
+
+def encode_jpeg(image, quality=75, subsampling='4:2:0', optimize=False, buf=None):
+    """
+        return the JPEG bytes of a PIL image or a frame array (see
+        convert.to_pil_image). buf is a BytesIO to encode into, it is reused
+        so its memory stays allocated between frames. By default each thread
+        uses its own buffer
+    """
+    if not hasattr(image, 'save'):
+        image = convert.to_pil_image(image)
+
+    if buf is None:
+        buf = getattr(_local, 'buf', None)
+        if buf is None:
+            buf = _local.buf = BytesIO()
+
+    buf.seek(0)
+    image.save(buf, 'JPEG', quality=quality, subsampling=SUBSAMPLING.get(subsampling, subsampling),
+               optimize=optimize)
+    # the buffer is not truncated, it may hold the tail of a larger frame
+    n = buf.tell()
+    with buf.getbuffer() as view:
+        return bytes(view[:n])
+
+
+class JpegEncoder(object):
+    """
+        encode frames to JPEG bytes on a pool of threads. PIL releases the
+        GIL while it compresses so frames are encoded in parallel:
+
+            enc = JpegEncoder(quality=80, threads=4)
+            future = enc.submit(cam.get_latest_frame())
+            sock.sendall(future.result())
+
+        submit accepts arrays and leased Frames, a Frame is released once it
+        is encoded. encode_times records the time spent encoding each frame
+    """
+
+    def __init__(self, quality=75, subsampling='4:2:0', optimize=False, threads=2):
+        if subsampling not in SUBSAMPLING:
+            raise ValueError('subsampling must be one of {}'.format(', '.join(SUBSAMPLING)))
+
+        self.quality = quality
+        self.subsampling = subsampling
+        self.optimize = optimize
+        self.encode_times = LatencyHistogram()
+        self.threads = threads
+        self.count = 0
+        self.nbytes = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix='toupcam-jpeg')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def encode(self, data):
+        'encode on the calling thread'
+        st = time.perf_counter()
+        if hasattr(data, 'release'):
+            with data:
+                jpeg = encode_jpeg(data.data, self.quality, self.subsampling, self.optimize)
+        else:
+            jpeg = encode_jpeg(data, self.quality, self.subsampling, self.optimize)
+
+        self.encode_times.record(time.perf_counter() - st)
+        with self._lock:
+            self.count += 1
+            self.nbytes += len(jpeg)
+        return jpeg
+
+    def submit(self, data):
+        'encode on the pool, return a concurrent.futures.Future of the bytes'
+        return self._pool.submit(self.encode, data)
+
+    def map(self, frames):
+        """
+            encode an iterable of frames on the pool, yield the bytes in
+            order. at most 2 * threads frames are in flight, frames is read
+            only as fast as the results are taken, e.g. map(cam.frames())
+        """
+        pending = deque()
+        for frame in frames:
+            pending.append(self._pool.submit(self.encode, frame))
+            if len(pending) >= 2 * self.threads:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        self._pool.shutdown()
+
+# ============= EOF =============================================
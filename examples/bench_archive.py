@@ -0,0 +1,69 @@
+# ===============================================================================
+# Copyright 2018 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+Compression ratio and speed of the frame archive on noisy 12 bit 1024x768
+raw frames, with and without byte shuffling, and the cost of a random read.
+
+    PYTHONPATH=. python examples/bench_archive.py
+"""
+import os
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+import archive
+
+N = 32
+
+
+def make_frame(h=768, w=1024):
+    y, x = np.mgrid[0:h, 0:w]
+    signal = 1500 + 1000 * np.sin(x / 50.0) * np.cos(y / 70.0)
+    return (signal + np.random.normal(0, 8, (h, w))).clip(0, 4095).astype(np.uint16)
+
+
+def main():
+    frame = make_frame()
+    raw = frame.tobytes()
+    for name, buf in (('plain', raw), ('shuffled', archive._shuffle(frame))):
+        st = time.perf_counter()
+        size = len(zlib.compress(buf, 1))
+        t = time.perf_counter() - st
+        print('{:<9s} ratio {:5.2f} {:7.2f} ms/frame'.format(name, len(raw) / size, t * 1000))
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.tca')
+    st = time.perf_counter()
+    with archive.ArchiveWriter(path) as arc:
+        for i in range(N):
+            arc.append(frame, i + 1, time.monotonic(), exposure=1000)
+    t = time.perf_counter() - st
+    print('append {:7.2f} ms/frame, {:.1f} MB on disk for {:.1f} MB'.format(t / N * 1000, os.path.getsize(path) / 1e6,
+                                                                          len(raw) * N / 1e6))
+
+    with archive.Archive(path) as arc:
+        idx = np.random.randint(0, N, 100)
+        st = time.perf_counter()
+        for i in idx:
+            arc[i]
+        print('random read {:7.2f} ms/frame'.format((time.perf_counter() - st) / len(idx) * 1000))
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
@@ -0,0 +1,46 @@
+# ===============================================================================
+# Copyright 2018 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+Per-frame cost of software binning a 2048x1536 BGRX frame and of converting
+the result, compared with converting the full frame.
+
+    PYTHONPATH=. python examples/bench_binning.py
+"""
+import timeit
+
+import numpy as np
+
+import convert
+
+
+def main(n=20):
+    w, h = 2048, 1536
+    data = np.random.randint(0, 2 ** 32, size=(h, w), dtype=np.uint32)
+
+    t = min(timeit.repeat(lambda: convert.to_pil_image(data), number=n, repeat=3)) / n
+    print('full frame to_pil_image {:8.3f} ms/frame'.format(t * 1000))
+    for factor in (2, 4):
+        for mode in convert.BIN_MODES:
+            binned = convert.bin_pixels(data, factor, mode)
+            tb = min(timeit.repeat(lambda: convert.bin_pixels(data, factor, mode), number=n, repeat=3)) / n
+            tc = min(timeit.repeat(lambda: convert.to_pil_image(binned), number=n, repeat=3)) / n
+            print('{}x{} {:<8s} bin {:8.3f} ms  to_pil_image {:8.3f} ms'.format(factor, factor, mode,
+                                                                            tb * 1000, tc * 1000))
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
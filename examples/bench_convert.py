@@ -0,0 +1,57 @@
+# ===============================================================================
+# Copyright 2018 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+Per-frame cost of converting a pulled BGRX frame to RGB at each eSize.
+
+    PYTHONPATH=. python examples/bench_convert.py
+"""
+import timeit
+
+import numpy as np
+from PIL import Image
+
+import convert
+
+# eSize 0, 1, 2 of a UCMOS03100KPA
+RESOLUTIONS = ((2048, 1536), (1024, 768), (680, 510))
+
+
+def split_merge(data):
+    'the original get_pil_image'
+    raw = data.view(np.uint8).reshape(data.shape + (-1,))
+    bgr = raw[..., :3]
+    image = Image.fromarray(bgr, 'RGB')
+    b, g, r = image.split()
+    return Image.merge('RGB', (r, g, b))
+
+
+def main(n=20):
+    for esize, (w, h) in enumerate(RESOLUTIONS):
+        data = np.random.randint(0, 2 ** 32, size=(h, w), dtype=np.uint32)
+        out = np.empty((h, w, 3), dtype=np.uint8)
+
+        print('eSize={} {}x{}'.format(esize, w, h))
+        for name, func in (('split/merge', lambda: split_merge(data)),
+                           ('to_pil_image', lambda: convert.to_pil_image(data)),
+                           ('to_rgb', lambda: convert.to_rgb(data)),
+                           ('to_rgb(out=)', lambda: convert.to_rgb(data, out))):
+            t = min(timeit.repeat(func, number=n, repeat=3)) / n
+            print('    {:<14s} {:8.3f} ms/frame'.format(name, t * 1000))
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
@@ -0,0 +1,51 @@
+# ===============================================================================
+# Copyright 2018 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+Demosaic throughput of each method on 12 bit RGGB mosaics at each eSize,
+single threaded and split across threads.
+
+    PYTHONPATH=. python examples/bench_demosaic.py [threads]
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+import demosaic
+
+# eSize 0, 1, 2 of a UCMOS03100KPA
+RESOLUTIONS = ((2048, 1536), (1024, 768), (680, 510))
+
+
+def main(n=5):
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else min(os.cpu_count() or 1, 4)
+    for esize, (w, h) in enumerate(RESOLUTIONS):
+        mosaic = np.random.randint(0, 4096, size=(h, w), dtype=np.uint16)
+        out = np.empty((h, w, 3), dtype=np.uint16)
+
+        print('eSize={} {}x{}'.format(esize, w, h))
+        for method in demosaic.METHODS:
+            for nt in sorted({1, threads}):
+                t = min(timeit.repeat(lambda: demosaic.demosaic(mosaic, 'RGGB', method, out, nt, 4095),
+                                      number=n, repeat=3)) / n
+                print('    {:<9s} threads={} {:8.2f} ms/frame {:7.1f} Mpixel/s'.format(method, nt, t * 1000,
+                                                                                  w * h / t / 1e6))
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
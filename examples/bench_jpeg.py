@@ -0,0 +1,76 @@
+# ===============================================================================
+# Copyright 2018 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+JPEG encoding throughput at each eSize: a fresh BytesIO per frame against the
+reused per thread buffer of encoder.encode_jpeg, and JpegEncoder thread pools.
+
+    PYTHONPATH=. python examples/bench_jpeg.py
+"""
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+
+import convert
+from encoder import encode_jpeg, JpegEncoder
+
+RESOLUTIONS = ((2048, 1536), (1024, 768), (680, 510))
+N = 20
+
+
+def make_frame(h, w):
+    y, x = np.mgrid[0:h, 0:w]
+    bgrx = np.zeros((h, w, 4), dtype=np.uint8)
+    bgrx[..., 0] = (x * 255 // w)
+    bgrx[..., 1] = (y * 255 // h)
+    bgrx[..., 2] = np.random.randint(0, 32, (h, w))
+    return bgrx.view(np.uint32).reshape(h, w)
+
+
+def fresh_buffer(data, quality):
+    buf = BytesIO()
+    convert.to_pil_image(data).save(buf, 'JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def main():
+    nthreads = min(os.cpu_count() or 1, 4)
+    for esize, (w, h) in enumerate(RESOLUTIONS):
+        data = make_frame(h, w)
+        print('eSize={} {}x{}'.format(esize, w, h))
+        for name, func in (('fresh BytesIO', lambda: fresh_buffer(data, 75)),
+                           ('encode_jpeg', lambda: encode_jpeg(data, 75)),
+                           ('encode_jpeg 4:4:4', lambda: encode_jpeg(data, 75, '4:4:4'))):
+            st = time.perf_counter()
+            for _ in range(N):
+                func()
+            t = (time.perf_counter() - st) / N
+            print('    {:<20s} {:7.2f} ms/frame'.format(name, t * 1000))
+
+        for threads in sorted({1, nthreads}):
+            with JpegEncoder(75, threads=threads) as enc:
+                st = time.perf_counter()
+                sizes = [len(j) for j in enc.map([data] * N)]
+                t = time.perf_counter() - st
+                s = enc.encode_times.summary()
+            print('    pool threads={}       {:7.1f} fps, encode p50={:.2f} ms, {:.0f} KB/frame'.format(
+                threads, N / t, s['p50'] * 1000, np.mean(sizes) / 1024))
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
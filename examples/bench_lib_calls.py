@@ -0,0 +1,73 @@
+# ===============================================================================
+# Copyright 2018 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+Per-call overhead of property get/set, dynamic lookup vs the prototyped table.
+
+"before" looks the function up with getattr('Toupcam_{}'.format(...)) on a
+library without argtypes, as ToupCamCamera._lib_func used to.
+"after" uses core.lib.table(). The calls are made with a NULL handle so the
+native library returns E_INVALIDARG immediately and only the call overhead is
+measured; no camera is needed.
+
+    PYTHONPATH=. python examples/bench_lib_calls.py
+"""
+import ctypes
+import os
+import timeit
+
+from core import lib, load_library, success
+
+N = 200000
+
+
+def main():
+    print('backend: {}'.format(os.environ.get('TOUPCAM_BACKEND', 'native')))
+    # a second handle to the library, without any prototypes
+    raw = load_library()
+    table = lib.table()
+    cam = None
+
+    def before_put():
+        ff = getattr(raw, 'Toupcam_{}'.format('put_ExpoTime'))
+        return success(ff(cam, ctypes.c_ulong(100)))
+
+    def before_get():
+        v = ctypes.c_int()
+        ff = getattr(raw, 'Toupcam_{}'.format('get_{}'.format('ExpoTime')))
+        if success(ff(cam, ctypes.byref(v))):
+            return v.value
+
+    vtype = table['get_ExpoTime'].argtypes[1]._type_
+
+    def after_put():
+        return success(table['put_ExpoTime'](cam, 100))
+
+    def after_get():
+        v = vtype()
+        if success(table['get_ExpoTime'](cam, ctypes.byref(v))):
+            return v.value
+
+    for name, func in (('put before', before_put),
+                       ('put after', after_put),
+                       ('get before', before_get),
+                       ('get after', after_get)):
+        t = min(timeit.repeat(func, number=N, repeat=3)) / N
+        print('    {:<12s} {:6.3f} us/call'.format(name, t * 1e6))
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
@@ -0,0 +1,65 @@
+# ===============================================================================
+# Copyright 2018 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+Throughput and latency of the capture pipeline, from the SDK callback to a
+consumer reading cam.frames(). Runs without a camera on the simulator:
+
+    TOUPCAM_BACKEND=sim TOUPCAM_SIM_FPS=60 PYTHONPATH=. python examples/bench_pipeline.py
+"""
+import os
+import time
+
+import numpy as np
+
+os.environ.setdefault('TOUPCAM_BACKEND', 'sim')
+
+from camera import ToupCamCamera
+
+
+def run(resolution, bits, duration=3.0):
+    cam = ToupCamCamera(resolution=resolution, bits=bits)
+    cam.cam_open()
+    w, h = cam.get_size()
+
+    latencies = []
+    st = time.monotonic()
+    for frame in cam.frames(timeout=1):
+        with frame:
+            latencies.append(time.monotonic() - frame.timestamp)
+        if time.monotonic() - st > duration:
+            break
+
+    elapsed = time.monotonic() - st
+    count, dropped = cam.get_frame_count(), cam.get_dropped_frames() + cam.get_skipped_frames()
+    cam.cam_close()
+
+    lat = np.array(latencies) * 1000
+    print('eSize={} {}x{} bits={:<2d} {:6.1f} fps  dropped={:<3d} '
+          'latency ms: median={:.2f} p99={:.2f} max={:.2f}'.format(resolution, w.value, h.value, bits,
+                                                                  count / elapsed, dropped,
+                                                                  np.median(lat), np.percentile(lat, 99),
+                                                                  lat.max()))
+
+
+def main():
+    for resolution in (0, 1, 2):
+        for bits in (8, 24, 32):
+            run(resolution, bits)
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
@@ -0,0 +1,66 @@
+# ===============================================================================
+# Copyright 2018 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+Sustained write rate of the memory mapped recorder for 12 bit 2048x1536 raw
+frames, compared with saving one .npy file per frame.
+
+    PYTHONPATH=. python examples/bench_recorder.py [directory]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from recorder import Recorder, Recording
+
+N = 200
+
+
+def main():
+    root = sys.argv[1] if len(sys.argv) > 1 else tempfile.mkdtemp()
+    frame = np.random.randint(0, 4096, size=(1536, 2048), dtype=np.uint16)
+    mb = frame.nbytes * N / 1e6
+
+    path = os.path.join(root, 'bench.rec')
+    st = time.perf_counter()
+    with Recorder(path, frame.shape, frame.dtype, N) as rec:
+        for i in range(N):
+            rec.write(frame, i + 1, time.monotonic())
+        rec.flush()
+    t = time.perf_counter() - st
+    print('recorder   {:7.1f} fps {:8.1f} MB/s'.format(N / t, mb / t))
+
+    st = time.perf_counter()
+    r = Recording(path)
+    for i in np.random.randint(0, N, 1000):
+        int(r[i][0, 0])
+    print('random access {:6.1f} us/frame'.format((time.perf_counter() - st) / 1000 * 1e6))
+    os.remove(path)
+
+    st = time.perf_counter()
+    for i in range(N):
+        np.save(os.path.join(root, 'f{:05d}.npy'.format(i)), frame)
+    t = time.perf_counter() - st
+    print('npy files  {:7.1f} fps {:8.1f} MB/s'.format(N / t, mb / t))
+    for i in range(N):
+        os.remove(os.path.join(root, 'f{:05d}.npy'.format(i)))
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
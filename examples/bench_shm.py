@@ -0,0 +1,84 @@
+# ===============================================================================
+# Copyright 2018 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+Cost of handing 1280x960 RGB32 frames to another process, pickled through a
+multiprocessing Pipe vs published into a shared memory ring. Each frame is
+acknowledged by the reader before the next one is sent, the time is the full
+round trip per frame.
+
+    PYTHONPATH=. python examples/bench_shm.py
+"""
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from shm import FramePublisher, FrameSubscriber
+
+N = 200
+SHAPE = (960, 1280)
+NAME = 'toupcam_bench'
+
+
+def pipe_reader(conn):
+    while 1:
+        data = conn.recv()
+        if data is None:
+            break
+        conn.send(int(data[0, 0]))
+
+
+def shm_reader(conn):
+    sub = FrameSubscriber(NAME)
+    while 1:
+        frame = sub.next_frame(copy=False)
+        if frame is None:
+            break
+        conn.send(int(frame.data[0, 0]))
+    sub.close()
+
+
+def run(name, target, send, close):
+    parent, child = mp.Pipe()
+    p = mp.Process(target=target, args=(child,))
+    p.start()
+
+    frame = np.zeros(SHAPE, np.uint32)
+    # warm up, the reader has to start and attach
+    send(parent, frame)
+    parent.recv()
+    st = time.perf_counter()
+    for i in range(N):
+        frame[0, 0] = i
+        send(parent, frame)
+        parent.recv()
+    t = (time.perf_counter() - st) / N
+
+    close(parent)
+    p.join()
+    print('{:<7s} {:7.3f} ms/frame'.format(name, t * 1000))
+
+
+def main():
+    run('pipe', pipe_reader, lambda conn, frame: conn.send(frame), lambda conn: conn.send(None))
+
+    pub = FramePublisher(NAME, SHAPE, np.uint32)
+    run('shm', shm_reader, lambda conn, frame: pub.publish(frame), lambda conn: pub.close())
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
@@ -0,0 +1,55 @@
+# ===============================================================================
+# Copyright 2018 ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+"""
+Latency from trigger() to the leased frame in software trigger mode.
+Runs on the simulator unless TOUPCAM_BACKEND=native:
+
+    TOUPCAM_BACKEND=sim TOUPCAM_SIM_FPS=60 PYTHONPATH=. python examples/bench_trigger.py
+"""
+import os
+
+os.environ.setdefault('TOUPCAM_BACKEND', 'sim')
+
+from camera import ToupCamCamera, TRIGGER_SOFTWARE, TRIGGER_VIDEO
+
+N = 100
+
+
+def main():
+    cam = ToupCamCamera(resolution=1, bits=24)
+    cam.cam_open()
+    cam.set_trigger_mode(TRIGGER_SOFTWARE)
+
+    failed = 0
+    for _ in range(N):
+        try:
+            with cam.trigger().result(timeout=2):
+                pass
+        except IOError:
+            failed += 1
+
+    cam.set_trigger_mode(TRIGGER_VIDEO)
+    cam.cam_close()
+
+    s = cam.trigger_latency.summary()
+    print('{} triggers, {} failed'.format(s['count'], failed))
+    print('latency ms: min={:.2f} mean={:.2f} p50={:.2f} p90={:.2f} p99={:.2f} max={:.2f}'.format(
+        *(s[k] * 1000 for k in ('min', 'mean', 'p50', 'p90', 'p99', 'max'))))
+
+
+if __name__ == '__main__':
+    main()
+# ============= EOF =============================================
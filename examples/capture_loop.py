@@ -13,28 +13,38 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ===============================================================================
-import time
+"""
+Save n images, one every t seconds, from the live stream.
+
+    PYTHONPATH=. python examples/capture_loop.py
+"""
+from itertools import islice
 
 from camera import ToupCamCamera
+from pipeline import pipeline
 
 
 def main():
-
-    cam = ToupCamCamera()
-    cam.open()
-
-    # wait for camera to startup
-    time.sleep(2)
-
     # capture n images
     n = 10
     # every t seconds
     t = 2
 
-    for i in xrange(n):
-        path = 'test_image-{:02d}.jpg'.format(i)
-        cam.save(path)
-        time.sleep(t)
+    cam = ToupCamCamera()
+    if not cam.cam_open():
+        print('Failed to open camera')
+        return
+
+    try:
+        # the first frame waits for the camera to start up, frames between
+        # the saved ones are released straight back to the buffer ring
+        stream = pipeline(cam.frames(timeout=5)).throttle(1.0 / t)
+        for i, frame in enumerate(islice(stream, n)):
+            with frame:
+                path = 'test_image-{:02d}.jpg'.format(i)
+                cam.get_pil_image(frame.data).save(path)
+    finally:
+        cam.cam_close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,210 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Drive every connected camera from one process
+"""
+# ============= standard library imports ========================
+import threading
+import time
+# ============= local library imports  ==========================
+from camera import ToupCamCamera
+from core import enum_cameras
+from stats import RateCounter
+from worker import DROP_OLDEST
+
+
+def _camera_id(cid):
+    return cid.decode('ascii', 'ignore') if isinstance(cid, bytes) else cid
+
+
+class CameraManager(object):
+    """
+        open cameras by id and read their frames through one iterator.
+
+        each camera keeps its own worker thread and buffer ring, so a slow or
+        stalled camera does not hold up the others:
+
+            manager = CameraManager()
+            manager.open()
+            for camera_id, frame in manager.frames(timeout=1):
+                with frame:
+                    process(camera_id, frame.data)
+            manager.close()
+
+        camera_id is the id from Toupcam_Enum as a str. Camera keyword
+        arguments (resolution, bits, nbuffers) are passed to ToupCamCamera
+    """
+
+    def __init__(self, **camera_kw):
+        self.camera_kw = camera_kw
+        self.cameras = {}
+        self.infos = {}
+        self._rates = {}
+        self._last_seqs = {}
+        self._skipped = {}
+        self._order = []
+        self._next = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self.frames()
+
+    def enumerate(self):
+        'return {camera_id: CameraInfo} for the connected cameras'
+        return {_camera_id(info.id): info for info in enum_cameras()}
+
+    def open(self, ids=None, policy=DROP_OLDEST, queue_size=8):
+        """
+            open and start the cameras with the given ids, all connected
+            cameras if ids is None. return the ids that were opened
+        """
+        infos = self.enumerate()
+        if ids is None:
+            ids = list(infos)
+
+        opened = []
+        for camera_id in ids:
+            if camera_id in self.cameras:
+                continue
+
+            info = infos.get(camera_id)
+            if info is None:
+                print('Camera "{}" not found'.format(camera_id))
+                continue
+
+            cam = ToupCamCamera(cid=info.id, **self.camera_kw)
+            if not cam.cam:
+                print('Failed to open camera "{}"'.format(camera_id))
+                continue
+
+            rate = RateCounter()
+            cam.add_frame_callback(self._make_callback(rate))
+            if not cam.cam_open(policy, queue_size):
+                print('Failed to start camera "{}"'.format(camera_id))
+                cam.cam_close()
+                continue
+
+            with self._cond:
+                self.cameras[camera_id] = cam
+                self.infos[camera_id] = info
+                self._rates[camera_id] = rate
+                self._last_seqs[camera_id] = None
+                self._skipped[camera_id] = 0
+                self._order.append(camera_id)
+            opened.append(camera_id)
+
+        return opened
+
+    def close(self, ids=None):
+        'stop and close the cameras with the given ids, all if ids is None'
+        if ids is None:
+            ids = list(self.cameras)
+
+        for camera_id in ids:
+            with self._cond:
+                cam = self.cameras.pop(camera_id, None)
+                self.infos.pop(camera_id, None)
+                self._rates.pop(camera_id, None)
+                self._last_seqs.pop(camera_id, None)
+                self._skipped.pop(camera_id, None)
+                if camera_id in self._order:
+                    self._order.remove(camera_id)
+                self._cond.notify_all()
+
+            if cam is not None:
+                cam.cam_close()
+
+    def get_camera(self, camera_id):
+        return self.cameras[camera_id]
+
+    def next_frame(self, timeout=None):
+        """
+            lease the next unread frame from any camera, return
+            (camera_id, Frame) or None if timeout expires.
+            cameras are visited round robin so a fast camera cannot starve the
+            others
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while 1:
+                order = self._order
+                n = len(order)
+                for i in range(n):
+                    idx = (self._next + i) % n
+                    camera_id = order[idx]
+                    frame = self.cameras[camera_id].get_next_frame(0)
+                    if frame is not None:
+                        self._next = idx + 1
+                        last = self._last_seqs[camera_id]
+                        if last is not None and frame.seq > last + 1:
+                            self._skipped[camera_id] += frame.seq - last - 1
+                        self._last_seqs[camera_id] = frame.seq
+                        return camera_id, frame
+
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+
+                self._cond.wait(remaining)
+
+    def frames(self, timeout=None):
+        """
+            yield (camera_id, Frame) as frames arrive. stops when no frame
+            arrives within timeout seconds. release each Frame when done
+        """
+        while 1:
+            item = self.next_frame(timeout)
+            if item is None:
+                return
+            yield item
+
+    def stats(self):
+        """
+            return {camera_id: dict(fps, frames, dropped, skipped)} where
+            dropped counts frames the camera could not pull, every buffer
+            leased or the worker queue full, and skipped the frames
+            overwritten before next_frame got to them
+        """
+        with self._cond:
+            items = [(cid, self.cameras[cid], self._rates[cid], self._skipped[cid]) for cid in self._order]
+
+        now = time.monotonic()
+        return {cid: dict(fps=rate.rate(now),
+                          frames=cam.get_frame_count() or 0,
+                          dropped=(cam.get_dropped_frames() or 0) + cam.get_worker_dropped(),
+                          skipped=skipped)
+                for cid, cam, rate, skipped in items}
+
+    # private
+    def _make_callback(self, rate):
+        def callback(seq, timestamp):
+            'runs on the camera worker thread'
+            rate.tick(timestamp)
+            with self._cond:
+                self._cond.notify_all()
+
+        return callback
+
+# ============= EOF =============================================
@@ -0,0 +1,273 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+MJPEG over HTTP live preview
+
+    server = MJPEGServer(cam, port=8080)
+    server.start()
+    # browse to http://host:8080/
+
+URLs, camera_id is the CameraManager id, "cam" for a single camera:
+    /                                  index page with every stream
+    /<camera_id>/stream?fps=5&quality=60   multipart/x-mixed-replace JPEG stream
+    /<camera_id>/snapshot.jpg          the latest frame
+
+Each frame is encoded once and the same bytes are sent to every client.
+Nothing is encoded while no client is waiting for a frame, each client gets
+at most the rate it asks for, independent of the capture rate.
+"""
+# ============= standard library imports ========================
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+# ============= local library imports  ==========================
+from stats import RateCounter
+
+BOUNDARY = 'toupcamframe'
+
+
+class _Channel(object):
+    """
+        latest JPEG of one camera, encoded on its own thread only while
+        clients are waiting
+    """
+
+    def __init__(self, camera, quality):
+        self.camera = camera
+        self.quality = quality
+        self.clients = 0
+        self.rate = RateCounter()
+
+        self.seq = 0
+        self.jpeg = None
+        # frames arrived so far, and how many had arrived when the frame of
+        # the current jpeg was taken
+        self._arrived = 0
+        self._source = 0
+        self._frame_seq = 0
+        self._waiting = 0
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='toupcam-mjpeg')
+        self._thread.daemon = True
+
+    def start(self):
+        self.camera.add_frame_callback(self._on_frame)
+        self._thread.start()
+
+    def stop(self):
+        self.camera.remove_frame_callback(self._on_frame)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def wait(self, after, timeout=None):
+        """
+            return (seq, jpeg) newer than after and encoded from the latest
+            frame at the time of the call or a later one. None on timeout or
+            stop
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            # the cached jpeg may be from when the last client was connected
+            need = self._arrived
+            self._waiting += 1
+            self._cond.notify_all()
+            try:
+                while (self.seq <= after or self._source < need) and not self._stopped:
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return
+                    self._cond.wait(remaining)
+
+                if not self._stopped:
+                    return self.seq, self.jpeg
+            finally:
+                self._waiting -= 1
+
+    # private
+    def _on_frame(self, seq, timestamp):
+        'runs on the camera worker thread'
+        with self._cond:
+            self._frame_seq = seq
+            self._arrived += 1
+            if self._waiting:
+                self._cond.notify_all()
+
+    def _run(self):
+        encoded = 0
+        while 1:
+            with self._cond:
+                # only encode a new frame that a client is waiting for
+                self._cond.wait_for(lambda: self._stopped or (self._waiting and self._arrived != encoded))
+                if self._stopped:
+                    return
+                seq, encoded = self._frame_seq, self._arrived
+
+            frame = self.camera.get_frame(seq)
+            if frame is None:
+                # overwritten already, the next frame is on its way
+                continue
+
+            try:
+                with frame:
+                    jpeg = self.camera.get_jpeg_data(frame.data, self.quality)
+            except BaseException as e:
+                print('mjpeg encode failed: {}'.format(e))
+                continue
+
+            self.rate.tick()
+            with self._cond:
+                self.seq += 1
+                self.jpeg = jpeg
+                self._source = encoded
+                self._cond.notify_all()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split('/') if p]
+        server = self.server.owner
+
+        if not parts:
+            self._send(200, 'text/html', server.index_html().encode('utf8'))
+            return
+
+        channel = server.channels.get(parts[0])
+        if channel is None or len(parts) != 2:
+            self._send(404, 'text/plain', b'Not found')
+        elif parts[1] == 'stream':
+            fps = float(query.get('fps', [server.fps])[0])
+            self._stream(channel, fps)
+        elif parts[1] == 'snapshot.jpg':
+            item = channel.wait(0, server.timeout)
+            if item is None:
+                self._send(503, 'text/plain', b'No frame')
+            else:
+                self._send(200, 'image/jpeg', item[1])
+        else:
+            self._send(404, 'text/plain', b'Not found')
+
+    def _send(self, code, ctype, body):
+        self.send_response(code)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, channel, fps):
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary={}'.format(BOUNDARY))
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        interval = 1.0 / fps if fps > 0 else 0
+        timeout = self.server.owner.timeout
+        last = 0
+        channel.clients += 1
+        try:
+            while 1:
+                st = time.monotonic()
+                item = channel.wait(last, timeout)
+                if item is None:
+                    break
+
+                last, jpeg = item
+                self.wfile.write('--{}\r\nContent-Type: image/jpeg\r\nContent-Length: {}\r\n\r\n'.format(
+                    BOUNDARY, len(jpeg)).encode('ascii'))
+                self.wfile.write(jpeg)
+                self.wfile.write(b'\r\n')
+                self.wfile.flush()
+
+                # per client throttle, the channel does not encode for this
+                # client while it sleeps
+                delay = interval - (time.monotonic() - st)
+                if delay > 0:
+                    time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            channel.clients -= 1
+
+
+class MJPEGServer(object):
+    """
+        serve the live frames of cameras as MJPEG streams.
+
+        cameras is an open ToupCamCamera, a {camera_id: camera} dict or a
+        CameraManager. fps is the default rate per client, clients can ask
+        for another rate with ?fps=. quality is the JPEG quality
+    """
+
+    def __init__(self, cameras, host='', port=8080, fps=10.0, quality=75, timeout=5.0):
+        if hasattr(cameras, 'cameras'):
+            cameras = cameras.cameras
+        elif not isinstance(cameras, dict):
+            cameras = {'cam': cameras}
+
+        self.fps = fps
+        self.timeout = timeout
+        self.channels = {str(cid): _Channel(cam, quality) for cid, cam in cameras.items()}
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    def start(self):
+        'serve on a background thread'
+        for channel in self.channels.values():
+            channel.start()
+
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='toupcam-http')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        for channel in self.channels.values():
+            channel.stop()
+
+    def stats(self):
+        'return {camera_id: dict(clients, fps)} where fps is the encode rate'
+        return {cid: dict(clients=c.clients, fps=c.rate.rate()) for cid, c in self.channels.items()}
+
+    def index_html(self):
+        imgs = ''.join('<figure><img src="/{0}/stream"><figcaption>{0}</figcaption></figure>'.format(cid)
+                       for cid in sorted(self.channels))
+        return '<!DOCTYPE html><html><head><title>ToupCam</title></head><body>{}</body></html>'.format(imgs)
+
+# ============= EOF =============================================
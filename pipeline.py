@@ -0,0 +1,278 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Composable stages for frame streams
+
+    stream = (pipeline(cam.frames(timeout=1))
+              .throttle(5)
+              .map(lambda frame: cam.get_rgb_data(frame.data))
+              .batch(4))
+    for rgbs in stream:
+        ...
+
+Stages pull from their source only when asked for an item, a slow consumer
+never makes frames pile up in memory. Frames the consumer does not keep up
+with are dropped by the camera's buffer ring and counted there
+(get_skipped_frames). Stages that discard items count them in dropped.
+
+Leased Frames are owned by the stage holding them: filter and throttle
+release the Frames they discard, map releases its input unless the function
+returns it, tee leases the Frame once per branch.
+"""
+# ============= standard library imports ========================
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+# ============= local library imports  ==========================
+from buffers import Frame
+
+_END = object()
+
+
+def release(item):
+    'release a leased Frame, or every Frame of a batch'
+    if isinstance(item, Frame):
+        item.release()
+    elif isinstance(item, list):
+        for i in item:
+            release(i)
+
+
+def pipeline(source):
+    'wrap any iterable, e.g. ToupCamCamera.frames(), as the first Stage'
+    return Source(source)
+
+
+class Stage(object):
+    """
+        an iterable step of a pipeline. count is the number of items passed
+        on, dropped the number discarded
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.count = 0
+        self.dropped = 0
+
+    def __iter__(self):
+        for item in self._run():
+            self.count += 1
+            yield item
+
+    def map(self, func, workers=0):
+        return Map(self, func, workers)
+
+    def filter(self, predicate):
+        return Filter(self, predicate)
+
+    def batch(self, n):
+        return Batch(self, n)
+
+    def throttle(self, rate):
+        return Throttle(self, rate)
+
+    def tee(self, n=2, maxsize=2):
+        return tee(self, n, maxsize)
+
+    # private
+    def _run(self):
+        raise NotImplementedError
+
+
+class Source(Stage):
+    def _run(self):
+        return iter(self.source)
+
+
+class Map(Stage):
+    """
+        yield func(item). with workers > 0 func runs on a thread pool with at
+        most 2 * workers items in flight, results keep the source order
+    """
+
+    def __init__(self, source, func, workers=0):
+        super(Map, self).__init__(source)
+        self.func = func
+        self.workers = workers
+
+    def _call(self, item):
+        try:
+            result = self.func(item)
+        except BaseException:
+            release(item)
+            raise
+
+        if result is not item:
+            release(item)
+        return result
+
+    def _run(self):
+        if not self.workers:
+            for item in self.source:
+                yield self._call(item)
+            return
+
+        pending = deque()
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='toupcam-map') as pool:
+            for item in self.source:
+                pending.append(pool.submit(self._call, item))
+                # backpressure, stop pulling until the oldest result is taken
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+
+class Filter(Stage):
+    'yield the items for which predicate(item) is true'
+
+    def __init__(self, source, predicate):
+        super(Filter, self).__init__(source)
+        self.predicate = predicate
+
+    def _run(self):
+        for item in self.source:
+            if self.predicate(item):
+                yield item
+            else:
+                self.dropped += 1
+                release(item)
+
+
+class Batch(Stage):
+    """
+        yield lists of n items, the last one may be shorter. A batch of
+        Frames holds n leases, the camera needs more than n buffers or the
+        frames have to be copied first, e.g. .map(Frame.copy).batch(n)
+    """
+
+    def __init__(self, source, n):
+        super(Batch, self).__init__(source)
+        self.n = n
+
+    def _run(self):
+        items = []
+        for item in self.source:
+            items.append(item)
+            if len(items) == self.n:
+                yield items
+                items = []
+
+        if items:
+            yield items
+
+
+class Throttle(Stage):
+    """
+        pass at most rate items per second. Items arriving sooner are
+        discarded, not delayed, so the stream never lags behind the camera
+    """
+
+    def __init__(self, source, rate):
+        super(Throttle, self).__init__(source)
+        self.interval = 1.0 / rate
+
+    def _run(self):
+        due = 0
+        for item in self.source:
+            now = time.monotonic()
+            if now < due:
+                self.dropped += 1
+                release(item)
+                continue
+
+            # stay on the grid so the average rate is kept, unless the source
+            # paused for longer than an interval
+            due = (due if now - due < self.interval else now) + self.interval
+            yield item
+
+
+class Branch(Stage):
+    'one output of tee, fed from a bounded queue'
+
+    def __init__(self, source, maxsize):
+        super(Branch, self).__init__(source)
+        self.queue = queue.Queue(maxsize)
+        self.closed = False
+
+    def close(self):
+        'stop consuming this branch, the other branches keep running'
+        self.closed = True
+        while 1:
+            try:
+                release(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+    def _run(self):
+        while 1:
+            item = self.queue.get()
+            if item is _END:
+                return
+            yield item
+
+
+def tee(source, n=2, maxsize=2):
+    """
+        split source into n Branches, each with its own queue of maxsize
+        items. A thread pulls the source and blocks while any open branch is
+        full, the slowest branch sets the pace. Consume the branches on
+        separate threads, close() a branch that is no longer read
+    """
+    branches = [Branch(source, maxsize) for _ in range(n)]
+
+    def copy(item):
+        if isinstance(item, Frame):
+            # each branch releases its own lease
+            return item.ring.lease(item.seq)
+        return item
+
+    def put(branch, item):
+        while not branch.closed:
+            try:
+                branch.queue.put(item, timeout=0.1)
+                if branch.closed:
+                    # closed while putting, do not leave the lease queued
+                    branch.close()
+                return
+            except queue.Full:
+                pass
+        release(item)
+
+    def pump():
+        try:
+            for item in source:
+                for branch in branches[1:]:
+                    if not branch.closed:
+                        put(branch, copy(item))
+                put(branches[0], item)
+
+                if all(b.closed for b in branches):
+                    break
+        finally:
+            for branch in branches:
+                put(branch, _END)
+
+    thread = threading.Thread(target=pump, name='toupcam-tee')
+    thread.daemon = True
+    thread.start()
+    return branches
+
+# ============= EOF =============================================
@@ -0,0 +1,79 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Raw sensor formats reported by Toupcam_get_RawFormat
+"""
+# ============= standard library imports ========================
+import numpy as np
+# ============= local library imports  ==========================
+
+
+def make_fourcc(code):
+    'MAKEFOURCC of a 4 character string, e.g. make_fourcc("RGGB")'
+    a, b, c, d = (ord(ch) for ch in code)
+    return a | (b << 8) | (c << 16) | (d << 24)
+
+
+def fourcc_to_str(fourcc):
+    return ''.join(chr((fourcc >> s) & 0xff) for s in (0, 8, 16, 24))
+
+
+FOURCC_GBRG = make_fourcc('GBRG')
+FOURCC_RGGB = make_fourcc('RGGB')
+FOURCC_BGGR = make_fourcc('BGGR')
+FOURCC_GRBG = make_fourcc('GRBG')
+FOURCC_YYYY = make_fourcc('YYYY')  # monochrome
+
+BAYER_PATTERNS = ('RGGB', 'GRBG', 'GBRG', 'BGGR')
+
+
+class RawFormat(object):
+    """
+        layout of raw frames.
+
+        pattern is the colour of the top left 2x2 block read row by row,
+        e.g. 'RGGB', or 'YYYY' for monochrome sensors. bits is the bit depth
+        of the pulled data: 8 bit data is stored as uint8, deeper data as
+        uint16 with the value in the low bits. sensor_bits is the deepest
+        depth the sensor supports
+    """
+
+    def __init__(self, fourcc, bits, sensor_bits=None):
+        self.fourcc = fourcc
+        self.pattern = fourcc_to_str(fourcc)
+        self.bits = bits
+        self.sensor_bits = sensor_bits or bits
+
+    def __repr__(self):
+        return 'RawFormat({!r}, bits={})'.format(self.pattern, self.bits)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.uint8 if self.bits <= 8 else np.uint16)
+
+    @property
+    def bytes_per_pixel(self):
+        return self.dtype.itemsize
+
+    @property
+    def max_value(self):
+        return (1 << self.bits) - 1
+
+    def is_bayer(self):
+        return self.pattern in BAYER_PATTERNS
+
+# ============= EOF =============================================
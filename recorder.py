@@ -0,0 +1,269 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Record frames uncompressed into a pre-allocated memory mapped file.
+
+Layout, all little endian:
+    header, 4096 bytes: magic, version, frame count, json metadata
+        (shape, dtype, capacity, raw format, camera serial, user fields)
+    index: capacity records of (seq uint64, timestamp float64)
+    frames: capacity fixed size records, starting on a 4096 byte boundary
+
+The frame count in the header is updated after every frame, a recording
+that was interrupted is readable up to the last complete frame.
+"""
+# ============= standard library imports ========================
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+# ============= local library imports  ==========================
+
+MAGIC = b'TCREC\x00\x00\x00'
+VERSION = 1
+HEADER_SIZE = 4096
+ALIGN = 4096
+
+_HEADER = struct.Struct('<8sIQI')
+_COUNT_OFFSET = 12
+INDEX_DTYPE = np.dtype([('seq', '<u8'), ('timestamp', '<f8')])
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(shape, dtype, capacity):
+    'return (index offset, frames offset, frame size, file size)'
+    frame_size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    index_offset = HEADER_SIZE
+    frames_offset = _align(index_offset + capacity * INDEX_DTYPE.itemsize)
+    return index_offset, frames_offset, frame_size, frames_offset + capacity * frame_size
+
+
+class Recorder(object):
+    """
+        append frames of a fixed shape and dtype to a memory mapped file
+        sized for capacity frames.
+
+            rec = Recorder('run1.rec', cam.get_image_data().shape, np.uint16, capacity=10000)
+            rec.attach(cam)   # record every frame on the camera worker thread
+            ...
+            rec.close()
+
+        the disk space is reserved up front. close() shrinks the file to the
+        recorded frames unless truncate is False
+    """
+
+    def __init__(self, path, shape, dtype, capacity, fmt=None, meta=None):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.capacity = capacity
+        self.count = 0
+        self.missed = 0
+        self.full = False
+
+        header = {'shape': self.shape, 'dtype': self.dtype.str, 'capacity': capacity}
+        if fmt is not None:
+            header['format'] = {'fourcc': fmt.fourcc, 'bits': fmt.bits, 'sensor_bits': fmt.sensor_bits}
+        if meta:
+            header['meta'] = meta
+
+        text = json.dumps(header).encode('utf8')
+        if _HEADER.size + len(text) > HEADER_SIZE:
+            raise ValueError('metadata too long')
+
+        index_offset, frames_offset, self._frame_size, size = _layout(self.shape, self.dtype, capacity)
+        with open(path, 'wb') as wfile:
+            wfile.write(_HEADER.pack(MAGIC, VERSION, 0, len(text)) + text)
+            wfile.truncate(size)
+            if hasattr(os, 'posix_fallocate'):
+                # reserve the blocks now, not when the disk is already busy
+                os.posix_fallocate(wfile.fileno(), 0, size)
+
+        self._header = np.memmap(path, np.uint8, 'r+', 0, HEADER_SIZE)
+        self._count = self._header[_COUNT_OFFSET:_COUNT_OFFSET + 8].view('<u8')
+        self.index = np.memmap(path, INDEX_DTYPE, 'r+', index_offset, (capacity,))
+        self.frames = np.memmap(path, self.dtype, 'r+', frames_offset, (capacity,) + self.shape)
+
+        self._last_seq = None
+        self._lock = threading.Lock()
+        self._camera = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @classmethod
+    def for_camera(cls, path, camera, capacity, meta=None):
+        'a Recorder sized for the frames of an open camera'
+        shape, dtype, fmt, meta = camera.get_recording_spec(meta)
+        return cls(path, shape, dtype, capacity, fmt, meta)
+
+    def write(self, data, seq=None, timestamp=0.0):
+        """
+            copy data into the next record. return False once the file is full.
+            gaps in seq are counted in missed
+        """
+        with self._lock:
+            n = self.count
+            if n >= self.capacity:
+                self.full = True
+                return False
+
+            self.frames[n] = data
+            if seq is None:
+                seq = n + 1
+            elif self._last_seq is not None and seq > self._last_seq + 1:
+                self.missed += seq - self._last_seq - 1
+            self._last_seq = seq
+
+            self.index[n] = (seq, timestamp)
+            self.count = n + 1
+            self._count[0] = n + 1
+            return True
+
+    def attach(self, camera):
+        'record every frame of camera from its worker thread until detach or close'
+        self._camera = camera
+        camera.add_frame_callback(self._on_frame)
+
+    def detach(self):
+        if self._camera is not None:
+            self._camera.remove_frame_callback(self._on_frame)
+            self._camera = None
+
+    def flush(self):
+        'write the mapped pages to disk'
+        for m in (self.frames, self.index, self._header):
+            m.flush()
+
+    def close(self, truncate=True):
+        self.detach()
+        with self._lock:
+            if self.frames is None:
+                return
+
+            self.flush()
+            count = self.count
+            frames_offset = self.frames.offset
+            self.frames = self.index = self._header = self._count = None
+
+        if truncate:
+            with open(self.path, 'r+b') as wfile:
+                wfile.truncate(frames_offset + count * self._frame_size)
+
+    # private
+    def _on_frame(self, seq, timestamp):
+        'runs on the camera worker thread'
+        if self.full:
+            return
+
+        frame = self._camera.get_frame(seq)
+        if frame is None:
+            with self._lock:
+                self.missed += 1
+                # so write does not count it again as a gap
+                self._last_seq = seq
+            return
+
+        with frame:
+            if not self.write(frame.data, seq, timestamp):
+                self.detach()
+
+
+class Recording(object):
+    """
+        read only random access to a file written by Recorder. Frames are
+        memory mapped views, nothing is read until it is used:
+
+            rec = Recording('run1.rec')
+            frame = rec[100]
+            i = rec.find_seq(1234)
+            j = rec.find_time(t)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as rfile:
+            head = rfile.read(HEADER_SIZE)
+
+        magic, version, count, n = _HEADER.unpack_from(head)
+        if magic != MAGIC:
+            raise ValueError('{} is not a recording'.format(path))
+        if version > VERSION:
+            raise ValueError('Unsupported recording version {}'.format(version))
+
+        header = json.loads(head[_HEADER.size:_HEADER.size + n].decode('utf8'))
+        self.shape = tuple(header['shape'])
+        self.dtype = np.dtype(header['dtype'])
+        self.capacity = header['capacity']
+        self.format = header.get('format')
+        self.meta = header.get('meta', {})
+
+        index_offset, frames_offset, frame_size, _ = _layout(self.shape, self.dtype, self.capacity)
+        # a recording that was not closed is not truncated
+        count = min(count, (os.path.getsize(path) - frames_offset) // frame_size)
+        self.count = count
+        if count:
+            self.index = np.memmap(path, INDEX_DTYPE, 'r', index_offset, (count,))
+            self.frames = np.memmap(path, self.dtype, 'r', frames_offset, (count,) + self.shape)
+        else:
+            self.index = np.zeros(0, INDEX_DTYPE)
+            self.frames = np.zeros((0,) + self.shape, self.dtype)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.frames[i]
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    @property
+    def seqs(self):
+        return self.index['seq']
+
+    @property
+    def timestamps(self):
+        return self.index['timestamp']
+
+    def find_seq(self, seq):
+        'position of the frame with sequence number seq, None if it was not recorded'
+        seqs = self.seqs
+        i = int(np.searchsorted(seqs, seq))
+        if i < len(seqs) and seqs[i] == seq:
+            return i
+
+    def find_time(self, timestamp):
+        'position of the frame closest to timestamp'
+        ts = self.timestamps
+        if not len(ts):
+            return
+
+        i = int(np.searchsorted(ts, timestamp))
+        if i == len(ts) or (i and timestamp - ts[i - 1] < ts[i] - timestamp):
+            i -= 1
+        return i
+
+# ============= EOF =============================================
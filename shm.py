@@ -0,0 +1,329 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Publish frames to other processes through a shared memory ring.
+
+Layout, all little endian:
+    header, 4096 bytes: magic, version, slot count, frame size, published
+        count, closed flag, json metadata (shape, dtype, raw format, user fields)
+    slots: nslots records of (generation uint64, seq uint64, timestamp float64)
+    frames: nslots fixed size records, starting on a 4096 byte boundary
+
+There is one writer and no locks. Every slot is a seqlock, the writer makes
+the generation odd while it copies a frame and even again when it is done, a
+reader checks the generation did not change while it read the slot.
+"""
+# ============= standard library imports ========================
+import json
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+# ============= local library imports  ==========================
+
+MAGIC = b'TCSHM\x00\x00\x00'
+VERSION = 1
+HEADER_SIZE = 4096
+ALIGN = 4096
+
+_HEADER = struct.Struct('<8sIIQQII')
+_COUNT_OFFSET = 24
+_CLOSED_OFFSET = 32
+SLOT_DTYPE = np.dtype([('generation', '<u8'), ('seq', '<u8'), ('timestamp', '<f8')])
+
+
+def _layout(shape, dtype, nslots):
+    'return (frames offset, frame size, total size)'
+    frame_size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    frames_offset = (HEADER_SIZE + nslots * SLOT_DTYPE.itemsize + ALIGN - 1) // ALIGN * ALIGN
+    return frames_offset, frame_size, frames_offset + nslots * frame_size
+
+
+def _attach(name):
+    'attach to an existing block without handing it to this process\'s resource tracker'
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # before python 3.13 attaching registers the block and the tracker
+        # unlinks it when the reader exits. a forked reader shares the
+        # publisher's tracker, so skip registering rather than unregister
+        from multiprocessing import resource_tracker
+
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+
+class _Ring(object):
+    def _map(self, shm, shape, dtype, nslots):
+        self._shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.nslots = nslots
+
+        frames_offset, _, _ = _layout(self.shape, self.dtype, nslots)
+        buf = shm.buf
+        self._count = np.ndarray((1,), '<u8', buf, _COUNT_OFFSET)
+        self._closed = np.ndarray((1,), '<u4', buf, _CLOSED_OFFSET)
+        self.slots = np.ndarray((nslots,), SLOT_DTYPE, buf, HEADER_SIZE)
+        self.frames = np.ndarray((nslots,) + self.shape, self.dtype, buf, frames_offset)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def count(self):
+        'number of frames published so far'
+        return int(self._count[0])
+
+    def _unmap(self):
+        self._count = self._closed = self.slots = self.frames = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # a caller still holds a zero copy view, the mapping goes with it
+            pass
+
+
+class FramePublisher(_Ring):
+    """
+        copy frames into a new shared memory block that FrameSubscriber can
+        attach to from other processes by name.
+
+            pub = FramePublisher.for_camera(cam, 'toupcam0')
+            pub.attach(cam)     # publish every frame from the worker thread
+            ...
+            pub.close()
+
+        a reader that keeps a zero copy view has nslots - 1 frame periods
+        before its slot is reused
+    """
+
+    def __init__(self, name, shape, dtype, nslots=8, fmt=None, meta=None):
+        dtype = np.dtype(dtype).newbyteorder('<')
+        header = {'shape': tuple(shape), 'dtype': dtype.str}
+        if fmt is not None:
+            header['format'] = {'fourcc': fmt.fourcc, 'bits': fmt.bits, 'sensor_bits': fmt.sensor_bits}
+        if meta:
+            header['meta'] = meta
+
+        text = json.dumps(header).encode('utf8')
+        if _HEADER.size + len(text) > HEADER_SIZE:
+            raise ValueError('metadata too long')
+
+        _, frame_size, size = _layout(shape, dtype, nslots)
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+        shm.buf[:_HEADER.size + len(text)] = _HEADER.pack(MAGIC, VERSION, nslots, frame_size, 0, 0,
+                                                         len(text)) + text
+        self._map(shm, shape, dtype, nslots)
+        self.slots[:] = 0
+
+        self._lock = threading.Lock()
+        self._camera = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @classmethod
+    def for_camera(cls, camera, name, nslots=8, meta=None):
+        'a FramePublisher sized for the frames of an open camera'
+        shape, dtype, fmt, meta = camera.get_recording_spec(meta)
+        return cls(name, shape, dtype, nslots, fmt, meta)
+
+    def publish(self, data, seq=None, timestamp=0.0):
+        'copy data into the next slot and make it the latest frame'
+        with self._lock:
+            if self.frames is None:
+                return False
+
+            n = int(self._count[0])
+            i = n % self.nslots
+            slots = self.slots
+            gen = int(slots['generation'][i])
+
+            slots['generation'][i] = gen + 1
+            self.frames[i] = data
+            slots['seq'][i] = n + 1 if seq is None else seq
+            slots['timestamp'][i] = timestamp
+            slots['generation'][i] = gen + 2
+            self._count[0] = n + 1
+            return True
+
+    def attach(self, camera):
+        'publish every frame of camera from its worker thread until detach or close'
+        self._camera = camera
+        camera.add_frame_callback(self._on_frame)
+
+    def detach(self):
+        if self._camera is not None:
+            self._camera.remove_frame_callback(self._on_frame)
+            self._camera = None
+
+    def close(self, unlink=True):
+        'mark the ring closed for subscribers and release it'
+        self.detach()
+        with self._lock:
+            if self.frames is None:
+                return
+            self._closed[0] = 1
+            shm = self._shm
+            self._unmap()
+
+        if unlink:
+            shm.unlink()
+
+    # private
+    def _on_frame(self, seq, timestamp):
+        'runs on the camera worker thread'
+        frame = self._camera.get_frame(seq)
+        if frame is not None:
+            with frame:
+                self.publish(frame.data, seq, timestamp)
+
+
+class SharedFrame(object):
+    """
+        zero copy view of a published frame. data may be overwritten once the
+        writer wraps around, check valid() after using it
+    """
+
+    def __init__(self, ring, index, generation, seq, timestamp):
+        self._ring = ring
+        self._index = index
+        self._generation = generation
+        self.seq = seq
+        self.timestamp = timestamp
+        self.data = ring.frames[index]
+
+    def valid(self):
+        'True if the slot was not rewritten since this frame was read'
+        return int(self._ring.slots['generation'][self._index]) == self._generation
+
+
+class FrameSubscriber(_Ring):
+    """
+        attach to a FramePublisher by name, from any process.
+
+            sub = FrameSubscriber('toupcam0')
+            frame = sub.next_frame(timeout=1)
+            if frame is not None:
+                process(frame.data)
+
+        readers never block the publisher, they always get the newest
+        frame and skip the ones published while they were busy; skipped
+        counts them
+    """
+
+    def __init__(self, name, poll=0.0005):
+        shm = _attach(name)
+        magic, version, nslots, _, _, _, n = _HEADER.unpack_from(shm.buf)
+        if magic != MAGIC:
+            shm.close()
+            raise ValueError('{} is not a frame ring'.format(name))
+        if version > VERSION:
+            shm.close()
+            raise ValueError('Unsupported frame ring version {}'.format(version))
+
+        header = json.loads(bytes(shm.buf[_HEADER.size:_HEADER.size + n]).decode('utf8'))
+        self._map(shm, header['shape'], header['dtype'], nslots)
+        self.format = header.get('format')
+        self.meta = header.get('meta', {})
+
+        self.poll = poll
+        self.skipped = 0
+        self._last = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self):
+        return self.frames is None or bool(self._closed[0])
+
+    def latest(self, copy=True):
+        """
+            return the newest frame, None if nothing was published yet.
+            copy=False returns a SharedFrame viewing the shared block,
+            otherwise a SharedFrame holding a private, consistent copy
+        """
+        while 1:
+            n = int(self._count[0])
+            if not n:
+                return
+
+            index = (n - 1) % self.nslots
+            # the generation the writer left in this slot for frame n
+            expected = 2 * ((n - 1) // self.nslots + 1)
+            slot = self.slots[index]
+            gen = int(slot['generation'])
+            if gen != expected:
+                # the writer already moved on, read the new latest
+                continue
+
+            seq, timestamp = int(slot['seq']), float(slot['timestamp'])
+            frame = SharedFrame(self, index, gen, seq, timestamp)
+            if not copy:
+                if frame.valid():
+                    break
+                continue
+
+            frame.data = frame.data.copy()
+            if frame.valid():
+                break
+
+        if self._last and n > self._last + 1:
+            self.skipped += n - self._last - 1
+        self._last = n
+        return frame
+
+    def next_frame(self, timeout=None, copy=True):
+        'wait for a frame newer than the last one read. None on timeout or when the publisher closed'
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while int(self._count[0]) <= self._last:
+            if self._closed[0]:
+                return
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            time.sleep(self.poll)
+
+        return self.latest(copy)
+
+    def __iter__(self):
+        'yield copied frames until the publisher closes'
+        while 1:
+            frame = self.next_frame()
+            if frame is None:
+                return
+            yield frame
+
+    def close(self):
+        if self.frames is not None:
+            self._unmap()
+
+# ============= EOF =============================================
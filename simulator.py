@@ -0,0 +1,635 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Pure python stand-in for libtoupcam.
+
+SimulatedLibrary implements the Toupcam_* functions used by camera.py with
+the same ctypes calling conventions, so the whole capture pipeline can run and
+be benchmarked without a camera. Select it with
+
+    TOUPCAM_BACKEND=sim
+
+Frames are synthetic BGR test patterns generated at TOUPCAM_SIM_FPS
+(default 30) for each resolution in TOUPCAM_SIM_RESOLUTIONS
+(default 2048x1536,1024x768,680x510). TOUPCAM_SIM_CAMERAS sets how many
+cameras are connected (default 1).
+"""
+# ============= standard library imports ========================
+import ctypes
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+# ============= local library imports  ==========================
+from core import HToupCam, ToupcamModel, ID_TYPE, TOUPCAM_EVENT_EXPOSURE, TOUPCAM_EVENT_TEMPTINT, \
+    TOUPCAM_EVENT_IMAGE, TOUPCAM_EVENT_STILLIMAGE, TOUPCAM_OPTION_TRIGGER, TOUPCAM_OPTION_BINNING, \
+    TOUPCAM_OPTION_RAW, TOUPCAM_OPTION_BITDEPTH
+from raw import FOURCC_RGGB
+
+S_OK = 0
+E_FAIL = -2147467259  # 0x80004005
+E_INVALIDARG = -2147024809  # 0x80070057
+
+DEFAULT_RESOLUTIONS = ((2048, 1536), (1024, 768), (680, 510))
+DEFAULT_FPS = 30.0
+
+# raw output of the simulated sensor
+RAW_FOURCC = FOURCC_RGGB
+RAW_BITS = 12
+
+
+def _value(v):
+    'python value of a ctypes instance or plain python object'
+    return getattr(v, 'value', v)
+
+
+def _deref(p):
+    'the ctypes object behind byref(x) or pointer(x)'
+    obj = getattr(p, '_obj', None)
+    if obj is None:
+        obj = p.contents
+    return obj
+
+
+def _set_out(p, v):
+    if p is not None:
+        _deref(p).value = v
+
+
+def _address(buf):
+    if isinstance(buf, int):
+        return buf
+    return _value(buf)
+
+
+def _text(s):
+    'str for the wide char fields of the windows SDK, bytes otherwise'
+    return s if ID_TYPE is ctypes.c_wchar_p else s.encode('ascii')
+
+
+def _camera_id(index):
+    return 'sim-{}'.format(index)
+
+
+def parse_resolutions(text):
+    'parse "2048x1536,1024x768" into ((2048, 1536), (1024, 768))'
+    return tuple(tuple(int(v) for v in r.lower().split('x')) for r in text.split(','))
+
+
+class InvalidHandle(Exception):
+    pass
+
+
+class SimFunction(object):
+    """
+        callable with settable argtypes/restype like a ctypes function pointer
+    """
+    argtypes = None
+    restype = None
+    errcheck = None
+
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+
+    def __call__(self, *args):
+        try:
+            return self.func(*args)
+        except InvalidHandle:
+            # NULL or closed handle, like the SDK
+            return E_INVALIDARG
+
+
+class SimCamera(object):
+    """
+        state of one simulated camera
+    """
+
+    def __init__(self, index, resolutions, fps):
+        self.index = index
+        self.resolutions = resolutions
+        self.fps = fps
+        self.serial = 'SIM{:013d}'.format(index)
+
+        self.esize = 0
+        # (x, y, w, h) set by Toupcam_put_Roi
+        self.roi = None
+        self.options = {}
+        self.props = {'Gamma': 100, 'Contrast': 0, 'Brightness': 0, 'Saturation': 128, 'Hue': 0}
+        self.expotime = 10000
+        self.again = 100
+        self.temptint = (6503, 1000)
+        self.auto_expo = False
+
+        self.callback = None
+        self.ctx = None
+        self.frame_seq = 0
+        self.frame_ready = False
+        # frames left to capture in trigger mode, -1 runs continuously
+        self.triggers = 0
+        self.stills = deque()
+        self.pending_stills = deque()
+        self.events = deque()
+
+        self._bases = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def size(self):
+        return self.resolutions[self.esize]
+
+    @property
+    def raw_bits(self):
+        'bit depth of raw frames, 0 if raw mode is off'
+        if not self.options.get(TOUPCAM_OPTION_RAW):
+            return 0
+        return RAW_BITS if self.options.get(TOUPCAM_OPTION_BITDEPTH) else 8
+
+    @property
+    def binning(self):
+        return self.options.get(TOUPCAM_OPTION_BINNING, 1) & 0x7f
+
+    @property
+    def frame_size(self):
+        'size of the video frames after the region and binning'
+        w, h = self.roi[2:] if self.roi else self.size
+        n = self.binning
+        return w // n, h // n
+
+    # streaming
+    def start(self, callback, ctx):
+        self.callback = callback
+        self.ctx = ctx
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='toupcam-sim-{}'.format(self.index))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def trigger(self, n):
+        'Toupcam_Trigger, 0xffff runs continuously and 0 cancels'
+        with self._lock:
+            if n == 0xffff:
+                self.triggers = -1
+            elif n == 0:
+                self.triggers = 0
+            elif self.triggers >= 0:
+                self.triggers += n
+        self._wake.set()
+
+    def post_event(self, event):
+        'deliver event from the camera thread, like the SDK does'
+        if self._thread:
+            self.events.append(event)
+
+    def _run(self):
+        period = 1.0 / self.fps
+        t = time.perf_counter()
+        while not self._stop.is_set():
+            if self.options.get(TOUPCAM_OPTION_TRIGGER):
+                fire = self._wait_trigger(t, period)
+                if fire:
+                    t = time.perf_counter()
+            else:
+                fire = True
+                t += period
+                delay = t - time.perf_counter()
+                if delay > 0:
+                    self._stop.wait(delay)
+                else:
+                    # fell behind, do not try to catch up
+                    t = time.perf_counter()
+
+            if self._stop.is_set():
+                break
+
+            while self.events:
+                self.callback(self.events.popleft(), self.ctx)
+
+            if fire:
+                with self._lock:
+                    self.frame_seq += 1
+                    self.frame_ready = True
+                self.callback(TOUPCAM_EVENT_IMAGE, self.ctx)
+
+            if self.pending_stills:
+                with self._lock:
+                    self.stills.append((self.pending_stills.popleft(), self.frame_seq))
+                self.callback(TOUPCAM_EVENT_STILLIMAGE, self.ctx)
+
+    def _wait_trigger(self, last, period):
+        """
+            wait for a trigger, frames are no closer than one frame period.
+            return True if a frame should be captured
+        """
+        if not self.triggers:
+            self._wake.wait(period)
+            self._wake.clear()
+
+        with self._lock:
+            if not self.triggers:
+                return False
+
+        delay = last + period - time.perf_counter()
+        if delay > 0:
+            self._stop.wait(delay)
+
+        with self._lock:
+            if not self.triggers:
+                return False
+            if self.triggers > 0:
+                self.triggers -= 1
+        return True
+
+    # frames
+    def pull_image(self, buf, bits, pitch, pw, ph):
+        with self._lock:
+            if not self.frame_ready:
+                return E_FAIL
+            self.frame_ready = False
+            seq = self.frame_seq
+
+        w, h = self.frame_size
+        _set_out(pw, w)
+        _set_out(ph, h)
+        if buf is not None:
+            # binned frames get a pattern of their own size
+            roi = self.roi if self.binning == 1 else None
+            self.render(_address(buf), w, h, bits, pitch, seq, roi)
+        return S_OK
+
+    def pull_still(self, buf, bits, pitch, pw, ph):
+        with self._lock:
+            if not self.stills:
+                return E_FAIL
+            esize, seq = self.stills[0]
+            if buf is not None:
+                self.stills.popleft()
+
+        w, h = self.resolutions[esize]
+        _set_out(pw, w)
+        _set_out(ph, h)
+        if buf is not None:
+            self.render(_address(buf), w, h, bits, pitch, seq)
+        return S_OK
+
+    def render(self, address, w, h, bits, pitch, seq, roi=None):
+        """
+            write a test pattern scrolled by seq into the memory at address.
+            roi is the (x, y, w, h) region of the full frame to write
+        """
+        raw_bits = self.raw_bits
+        if raw_bits:
+            # bits is ignored in raw mode
+            bpp = 1 if raw_bits == 8 else 2
+            if not pitch:
+                pitch = w * bpp
+        else:
+            bpp = {8: 1, 24: 3, 32: 4}.get(bits, 4)
+            if not pitch:
+                pitch = w * bpp if bits == 32 else ((bits * w + 31) & ~31) // 8
+
+        raw = (ctypes.c_uint8 * (pitch * h)).from_address(address)
+        dst = np.frombuffer(raw, dtype=np.uint8).reshape(h, pitch)[:, :w * bpp].reshape(h, w, bpp)
+
+        if roi:
+            fw, fh = self.size
+            base = self._base(fw, fh, bpp, raw_bits)
+            x, y = roi[:2]
+            cols = (np.arange(x, x + w) + seq * 8) % fw
+            dst[:] = base[y:y + h, cols]
+            return
+
+        base = self._base(w, h, bpp, raw_bits)
+        s = (seq * 8) % w
+        dst[:, :w - s] = base[:, s:]
+        dst[:, w - s:] = base[:, :s]
+
+    def _base(self, w, h, bpp, raw_bits=0):
+        'the unscrolled pattern as (h, w, bytes per pixel) uint8'
+        key = (w, h, bpp, raw_bits)
+        base = self._bases.get(key)
+        if base is None and raw_bits:
+            # RGGB mosaic of the colour pattern
+            bgr = self._base(w, h, 3)
+            mosaic = bgr[..., 1].astype(np.uint16)
+            mosaic[0::2, 0::2] = bgr[0::2, 0::2, 2]
+            mosaic[1::2, 1::2] = bgr[1::2, 1::2, 0]
+            mosaic <<= raw_bits - 8
+            dtype = np.uint8 if raw_bits == 8 else np.dtype('<u2')
+            base = mosaic.astype(dtype).view(np.uint8).reshape(h, w, bpp)
+            self._bases[key] = base
+        elif base is None:
+            x = np.linspace(0, 255, w, dtype=np.float32)
+            y = np.linspace(0, 255, h, dtype=np.float32)[:, np.newaxis]
+            base = np.zeros((h, w, bpp), dtype=np.uint8)
+            if bpp == 1:
+                base[..., 0] = (x + y) / 2
+            else:
+                base[..., 0] = 255 - x
+                base[..., 1] = y
+                base[..., 2] = x
+            self._bases[key] = base
+        return base
+
+
+class SimulatedLibrary(object):
+    """
+        drop-in replacement for the ctypes handle of libtoupcam
+    """
+
+    def __init__(self, resolutions=None, fps=None, ncameras=None):
+        if resolutions is None:
+            resolutions = os.environ.get('TOUPCAM_SIM_RESOLUTIONS')
+            resolutions = parse_resolutions(resolutions) if resolutions else DEFAULT_RESOLUTIONS
+        if fps is None:
+            fps = float(os.environ.get('TOUPCAM_SIM_FPS', DEFAULT_FPS))
+        if ncameras is None:
+            ncameras = int(os.environ.get('TOUPCAM_SIM_CAMERAS', 1))
+
+        self.resolutions = tuple(resolutions)
+        self.fps = fps
+        self.ncameras = ncameras
+        self._handles = {}
+        self._model = ToupcamModel(_text('Simulated Camera'))
+
+        for name in dir(self):
+            if name.startswith('Toupcam_'):
+                setattr(self, name, SimFunction(getattr(self, name)))
+
+    def _cam(self, h):
+        try:
+            return self._handles[ctypes.addressof(h.contents)][1]
+        except (ValueError, AttributeError, KeyError):
+            raise InvalidHandle()
+
+    # lifetime
+    def Toupcam_Enum(self, insts):
+        for i in range(self.ncameras):
+            insts[i].displayname = _text('Simulated Camera {}'.format(i))
+            insts[i].id = _text(_camera_id(i))
+            insts[i].model = ctypes.pointer(self._model)
+        return self.ncameras
+
+    def Toupcam_EnumV2(self, insts):
+        return self.Toupcam_Enum(insts)
+
+    def Toupcam_Open(self, cid):
+        opened = [cam.index for _, cam in self._handles.values()]
+        if cid is None:
+            free = [i for i in range(self.ncameras) if i not in opened]
+            index = free[0] if free else None
+        else:
+            cid = cid.decode('ascii') if isinstance(cid, bytes) else cid
+            ids = [_camera_id(i) for i in range(self.ncameras)]
+            index = ids.index(cid) if cid in ids else None
+
+        if index is None or index in opened:
+            return ctypes.POINTER(HToupCam)()
+
+        handle = HToupCam()
+        cam = SimCamera(index, self.resolutions, self.fps)
+        # keep the structure alive as long as the handle is open
+        self._handles[ctypes.addressof(handle)] = (handle, cam)
+        return ctypes.pointer(handle)
+
+    def Toupcam_Close(self, h):
+        if h:
+            self._cam(h).stop()
+            self._handles.pop(ctypes.addressof(h.contents), None)
+
+    def Toupcam_StartPullModeWithCallback(self, h, callback, ctx=None):
+        self._cam(h).start(callback, ctx)
+        return S_OK
+
+    def Toupcam_Stop(self, h):
+        self._cam(h).stop()
+        return S_OK
+
+    # frames
+    def Toupcam_PullImage(self, h, buf, bits, pw, ph):
+        return self._cam(h).pull_image(buf, _value(bits), 0, pw, ph)
+
+    def Toupcam_PullImageWithRowPitch(self, h, buf, bits, pitch, pw, ph):
+        return self._cam(h).pull_image(buf, _value(bits), _value(pitch), pw, ph)
+
+    def Toupcam_PullStillImage(self, h, buf, bits, pw, ph):
+        return self._cam(h).pull_still(buf, _value(bits), 0, pw, ph)
+
+    def Toupcam_PullStillImageWithRowPitch(self, h, buf, bits, pitch, pw, ph):
+        return self._cam(h).pull_still(buf, _value(bits), _value(pitch), pw, ph)
+
+    def Toupcam_Snap(self, h, index):
+        return self.Toupcam_SnapN(h, index, 1)
+
+    def Toupcam_SnapN(self, h, index, n):
+        cam = self._cam(h)
+        index = _value(index)
+        if index >= len(cam.resolutions):
+            return E_INVALIDARG
+        cam.pending_stills.extend([index] * _value(n))
+        return S_OK
+
+    def Toupcam_Trigger(self, h, n):
+        cam = self._cam(h)
+        if not cam.options.get(TOUPCAM_OPTION_TRIGGER):
+            # not in trigger mode
+            return E_FAIL
+        cam.trigger(_value(n))
+        return S_OK
+
+    # resolution
+    def Toupcam_put_eSize(self, h, index):
+        cam = self._cam(h)
+        index = _value(index)
+        if index >= len(cam.resolutions):
+            return E_INVALIDARG
+        cam.esize = index
+        cam.roi = None
+        return S_OK
+
+    def Toupcam_get_eSize(self, h, pindex):
+        _set_out(pindex, self._cam(h).esize)
+        return S_OK
+
+    def Toupcam_put_Size(self, h, w, hh):
+        cam = self._cam(h)
+        try:
+            cam.esize = cam.resolutions.index((_value(w), _value(hh)))
+        except ValueError:
+            return E_INVALIDARG
+        return S_OK
+
+    def Toupcam_get_Size(self, h, pw, ph):
+        w, hh = self._cam(h).size
+        _set_out(pw, w)
+        _set_out(ph, hh)
+        return S_OK
+
+    def Toupcam_get_ResolutionNumber(self, h):
+        return len(self._cam(h).resolutions)
+
+    def Toupcam_get_Resolution(self, h, index, pw, ph):
+        cam = self._cam(h)
+        index = _value(index)
+        if index >= len(cam.resolutions):
+            return E_INVALIDARG
+        w, hh = cam.resolutions[index]
+        _set_out(pw, w)
+        _set_out(ph, hh)
+        return S_OK
+
+    def Toupcam_put_Roi(self, h, x, y, w, hh):
+        cam = self._cam(h)
+        x, y, w, hh = (_value(v) for v in (x, y, w, hh))
+        if not (x or y or w or hh):
+            cam.roi = None
+            return S_OK
+
+        fw, fh = cam.size
+        if (x | y | w | hh) & 1 or w < 16 or hh < 16 or x + w > fw or y + hh > fh:
+            return E_INVALIDARG
+        cam.roi = (x, y, w, hh)
+        return S_OK
+
+    def Toupcam_get_Roi(self, h, px, py, pw, ph):
+        cam = self._cam(h)
+        x, y, w, hh = cam.roi or ((0, 0) + cam.size)
+        for p, v in ((px, x), (py, y), (pw, w), (ph, hh)):
+            _set_out(p, v)
+        return S_OK
+
+    def Toupcam_get_RawFormat(self, h, pfourcc, pbits):
+        self._cam(h)
+        _set_out(pfourcc, RAW_FOURCC)
+        _set_out(pbits, RAW_BITS)
+        return S_OK
+
+    # options
+    def Toupcam_put_Option(self, h, option, value):
+        cam = self._cam(h)
+        option, value = _value(option), _value(value)
+        if option == TOUPCAM_OPTION_BINNING and value not in (1, 2, 3, 4, 0x82, 0x83, 0x84):
+            return E_INVALIDARG
+        cam.options[option] = value
+        if option == TOUPCAM_OPTION_TRIGGER:
+            cam.trigger(0)
+        return S_OK
+
+    def Toupcam_get_Option(self, h, option, pvalue):
+        _set_out(pvalue, self._cam(h).options.get(_value(option), 0))
+        return S_OK
+
+    # image properties
+    def _put_prop(self, name):
+        def put(h, v):
+            self._cam(h).props[name] = _value(v)
+            return S_OK
+
+        return put
+
+    def _get_prop(self, name):
+        def get(h, pv):
+            _set_out(pv, self._cam(h).props[name])
+            return S_OK
+
+        return get
+
+    def __getattr__(self, name):
+        # Toupcam_put_Gamma, Toupcam_get_Hue, ...
+        prefix, _, prop = name.rpartition('_')
+        if prefix in ('Toupcam_put', 'Toupcam_get') and prop in ('Gamma', 'Contrast', 'Brightness',
+                                                                  'Saturation', 'Hue'):
+            func = self._put_prop(prop) if prefix.endswith('put') else self._get_prop(prop)
+            func.__name__ = name
+            func = SimFunction(func)
+            setattr(self, name, func)
+            return func
+        raise AttributeError('function \'{}\' not found'.format(name))
+
+    def Toupcam_put_ExpoTime(self, h, v):
+        cam = self._cam(h)
+        cam.expotime = _value(v)
+        cam.post_event(TOUPCAM_EVENT_EXPOSURE)
+        return S_OK
+
+    def Toupcam_get_ExpoTime(self, h, pv):
+        _set_out(pv, self._cam(h).expotime)
+        return S_OK
+
+    def Toupcam_put_ExpoAGain(self, h, v):
+        cam = self._cam(h)
+        cam.again = _value(v)
+        cam.post_event(TOUPCAM_EVENT_EXPOSURE)
+        return S_OK
+
+    def Toupcam_get_ExpoAGain(self, h, pv):
+        _set_out(pv, self._cam(h).again)
+        return S_OK
+
+    def Toupcam_put_AutoExpoEnable(self, h, v):
+        self._cam(h).auto_expo = bool(_value(v))
+        return S_OK
+
+    def Toupcam_get_AutoExpoEnable(self, h, pv):
+        _set_out(pv, self._cam(h).auto_expo)
+        return S_OK
+
+    def Toupcam_put_TempTint(self, h, temp, tint):
+        cam = self._cam(h)
+        cam.temptint = (_value(temp), _value(tint))
+        cam.post_event(TOUPCAM_EVENT_TEMPTINT)
+        return S_OK
+
+    def Toupcam_get_TempTint(self, h, ptemp, ptint):
+        temp, tint = self._cam(h).temptint
+        _set_out(ptemp, temp)
+        _set_out(ptint, tint)
+        return S_OK
+
+    def Toupcam_AwbOnePush(self, h, callback, ctx=None):
+        cam = self._cam(h)
+        cam.temptint = (6503, 1000)
+        cam.post_event(TOUPCAM_EVENT_TEMPTINT)
+        if callback:
+            callback(cam.temptint[0], cam.temptint[1], ctx)
+        return S_OK
+
+    # info
+    def Toupcam_get_SerialNumber(self, h, buf):
+        buf.value = self._cam(h).serial.encode('ascii')
+        return S_OK
+
+    def Toupcam_get_FwVersion(self, h, buf):
+        buf.value = b'1.0.0'
+        return S_OK
+
+    def Toupcam_get_HwVersion(self, h, buf):
+        buf.value = b'1.0'
+        return S_OK
+
+# ============= EOF =============================================
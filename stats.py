@@ -0,0 +1,145 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Lightweight counters for frame rates and timings
+"""
+# ============= standard library imports ========================
+import bisect
+import math
+import threading
+import time
+from collections import deque
+# ============= local library imports  ==========================
+
+
+class RateCounter(object):
+    """
+        events per second over a sliding window of the last window seconds.
+        tick() is cheap enough to call from the frame handling thread
+    """
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.count = 0
+        self._stamps = deque()
+        self._lock = threading.Lock()
+
+    def tick(self, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        with self._lock:
+            self.count += 1
+            self._stamps.append(timestamp)
+            self._trim(timestamp)
+
+    def rate(self, now=None):
+        'events per second, 0 until two events are in the window'
+        if now is None:
+            now = time.monotonic()
+
+        with self._lock:
+            self._trim(now)
+            stamps = self._stamps
+            if len(stamps) < 2:
+                return 0.0
+
+            dt = stamps[-1] - stamps[0]
+            return (len(stamps) - 1) / dt if dt > 0 else 0.0
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self._stamps.clear()
+
+    # private
+    def _trim(self, now):
+        stamps = self._stamps
+        limit = now - self.window
+        while stamps and stamps[0] < limit:
+            stamps.popleft()
+
+
+class LatencyHistogram(object):
+    """
+        histogram of latencies in seconds with logarithmic bins, from lo to
+        hi seconds with nbins per decade. Values outside the range go to the
+        first or last bin. record() is cheap, percentiles are approximated by
+        the upper edge of the bin they fall in
+    """
+
+    def __init__(self, lo=1e-5, hi=10.0, nbins=20):
+        decades = math.log10(hi / lo)
+        n = int(round(decades * nbins))
+        self.edges = [lo * 10 ** (i / float(nbins)) for i in range(n + 1)]
+        self.counts = [0] * (n + 2)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def record(self, latency):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.edges, latency)] += 1
+            self.count += 1
+            self.total += latency
+            if self.min is None or latency < self.min:
+                self.min = latency
+            if self.max is None or latency > self.max:
+                self.max = latency
+
+    def mean(self):
+        if self.count:
+            return self.total / self.count
+
+    def percentile(self, p):
+        'latency below which p percent of the values fall'
+        with self._lock:
+            if not self.count:
+                return
+
+            target = self.count * p / 100.0
+            acc = 0
+            for i, c in enumerate(self.counts):
+                acc += c
+                if acc >= target and c:
+                    break
+
+            if i == 0:
+                return self.min
+            if i > len(self.edges) - 1:
+                return self.max
+            return min(self.edges[i], self.max)
+
+    def summary(self):
+        'dict of count, min, mean, p50, p90, p99 and max in seconds'
+        return dict(count=self.count, min=self.min, mean=self.mean(),
+                    p50=self.percentile(50), p90=self.percentile(90), p99=self.percentile(99),
+                    max=self.max)
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * len(self.counts)
+            self.count = 0
+            self.total = 0.0
+            self.min = self.max = None
+
+# ============= EOF =============================================
@@ -0,0 +1,180 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Group frames from several cameras into time matched sets
+"""
+# ============= standard library imports ========================
+import threading
+import time
+# ============= local library imports  ==========================
+from camera import TRIGGER_SOFTWARE, TRIGGER_VIDEO
+
+
+class FrameSet(object):
+    """
+        one leased Frame per camera, all captured within the tolerance of the
+        FrameSynchronizer. release() (or a with block) releases every frame
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        stamps = [f.timestamp for f in frames.values()]
+        self.timestamp = sum(stamps) / len(stamps)
+        self.spread = max(stamps) - min(stamps)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def __getitem__(self, camera_id):
+        return self.frames[camera_id]
+
+    def __iter__(self):
+        return iter(self.frames.items())
+
+    def __len__(self):
+        return len(self.frames)
+
+    def release(self):
+        for f in self.frames.values():
+            f.release()
+
+
+class FrameSynchronizer(object):
+    """
+        match frames of several cameras by timestamp.
+
+        every frame is stamped with time.monotonic() when the SDK callback
+        fires (see worker.EventWorker.post), so all cameras share one clock.
+        The oldest unread frame of each camera is compared, when they lie
+        within tolerance seconds of each other they are returned as a
+        FrameSet, otherwise the oldest one is released and counted in
+        unmatched.
+
+        cameras is a {camera_id: ToupCamCamera} dict or a CameraManager, the
+        cameras must already be open. With trigger=True the cameras are put
+        in software trigger mode and grab() fires one trigger on every camera
+        back to back before waiting for the set:
+
+            sync = FrameSynchronizer(manager, tolerance=0.002, trigger=True)
+            with sync.grab(timeout=1) as frames:
+                left, right = frames['sim-0'].data, frames['sim-1'].data
+    """
+
+    def __init__(self, cameras, tolerance=0.005, trigger=False):
+        if hasattr(cameras, 'cameras'):
+            cameras = cameras.cameras
+
+        self.cameras = dict(cameras)
+        self.tolerance = tolerance
+        self.trigger_mode = trigger
+        self.matched = 0
+        self.unmatched = {cid: 0 for cid in self.cameras}
+
+        self._heads = {cid: None for cid in self.cameras}
+        self._cond = threading.Condition()
+        for cam in self.cameras.values():
+            cam.add_frame_callback(self._on_frame)
+            if trigger:
+                cam.set_trigger_mode(TRIGGER_SOFTWARE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self.sets()
+
+    def close(self):
+        'release held frames, unregister from the cameras and leave trigger mode'
+        with self._cond:
+            for cid, head in self._heads.items():
+                if head is not None:
+                    head.release()
+                self._heads[cid] = None
+
+        for cam in self.cameras.values():
+            cam.remove_frame_callback(self._on_frame)
+            if self.trigger_mode:
+                cam.set_trigger_mode(TRIGGER_VIDEO)
+
+    def trigger(self):
+        'fire one software trigger on every camera. return True if all succeeded'
+        return all([cam.software_trigger(1) for cam in self.cameras.values()])
+
+    def grab(self, timeout=None):
+        'trigger every camera and return the matched FrameSet, None on timeout'
+        if not self.trigger():
+            return
+        return self.next_set(timeout)
+
+    def next_set(self, timeout=None):
+        'return the next matched FrameSet, None if timeout expires'
+        deadline = None if timeout is None else time.monotonic() + timeout
+        heads = self._heads
+        with self._cond:
+            while 1:
+                for cid, cam in self.cameras.items():
+                    if heads[cid] is None:
+                        heads[cid] = cam.get_next_frame(0)
+
+                if all(f is not None for f in heads.values()):
+                    first = min(heads, key=lambda k: heads[k].timestamp)
+                    last = max(heads, key=lambda k: heads[k].timestamp)
+                    if heads[last].timestamp - heads[first].timestamp <= self.tolerance:
+                        frames = dict(heads)
+                        for cid in heads:
+                            heads[cid] = None
+                        self.matched += 1
+                        return FrameSet(frames)
+
+                    # too old to match the newest head, it can never be in a set
+                    heads[first].release()
+                    heads[first] = None
+                    self.unmatched[first] += 1
+                    continue
+
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+
+                self._cond.wait(remaining)
+
+    def sets(self, timeout=None):
+        """
+            yield matched FrameSets until none arrives within timeout seconds.
+            in trigger mode each set is grabbed on demand
+        """
+        while 1:
+            fs = self.grab(timeout) if self.trigger_mode else self.next_set(timeout)
+            if fs is None:
+                return
+            yield fs
+
+    # private
+    def _on_frame(self, seq, timestamp):
+        'runs on a camera worker thread'
+        with self._cond:
+            self._cond.notify_all()
+
+# ============= EOF =============================================
@@ -0,0 +1,151 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Worker thread that handles SDK events outside of the SDK callback thread
+"""
+# ============= standard library imports ========================
+import threading
+import time
+import traceback
+from collections import deque
+# ============= local library imports  ==========================
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+BLOCK = 'block'
+
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+_STOP = object()
+
+
+class EventWorker(object):
+    """
+        queue of (event, timestamp) drained by a daemon thread.
+
+        post() is called from the SDK callback and only stamps and enqueues the
+        event. handler(event, timestamp) runs on the worker thread.
+
+        droppable(event) tells which events are subject to the policy, all of
+        them if droppable is None. When maxsize droppable events are queued
+        the policy decides what happens to the next one:
+            drop_oldest: discard the oldest queued droppable event
+            drop_newest: discard the event being posted
+            block: wait for room (stalls the SDK callback thread)
+        other events are always queued, they are never lost behind a backlog
+    """
+
+    def __init__(self, handler, maxsize=8, policy=DROP_OLDEST, name='toupcam-worker', droppable=None):
+        if policy not in POLICIES:
+            raise ValueError('policy must be one of {}'.format(', '.join(POLICIES)))
+
+        self.handler = handler
+        self.maxsize = maxsize
+        self.policy = policy
+        self.droppable = droppable
+        self.dropped = 0
+        self._stopped = False
+
+        # (droppable, event, timestamp)
+        self._items = deque()
+        self._ndroppable = 0
+        self._unfinished = 0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        'process the queued events then stop the thread. later events are ignored'
+        with self._cond:
+            self._stopped = True
+            if self._thread.is_alive():
+                self._items.append((False, _STOP, 0))
+                self._unfinished += 1
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def post(self, event):
+        'called from the SDK callback thread'
+        if self._stopped:
+            return
+
+        drop = self.droppable is None or self.droppable(event)
+        item = (drop, event, time.monotonic())
+        with self._cond:
+            if drop:
+                while self._ndroppable >= self.maxsize:
+                    if self.policy == BLOCK:
+                        self._cond.wait()
+                        if self._stopped:
+                            return
+                        continue
+
+                    self.dropped += 1
+                    if self.policy == DROP_NEWEST:
+                        return
+                    self._remove_oldest()
+
+                self._ndroppable += 1
+
+            self._items.append(item)
+            self._unfinished += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        'wait until every posted event is handled. return False on timeout'
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._unfinished, timeout)
+
+    def qsize(self):
+        return len(self._items)
+
+    # private
+    def _remove_oldest(self):
+        items = self._items
+        for i, item in enumerate(items):
+            if item[0]:
+                del items[i]
+                self._ndroppable -= 1
+                self._unfinished -= 1
+                return
+
+    def _run(self):
+        cond = self._cond
+        while 1:
+            with cond:
+                cond.wait_for(lambda: self._items)
+                drop, event, timestamp = self._items.popleft()
+                if drop:
+                    self._ndroppable -= 1
+                    # room for a blocked post
+                    cond.notify_all()
+
+            try:
+                if event is _STOP:
+                    break
+                self.handler(event, timestamp)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                with cond:
+                    self._unfinished -= 1
+                    cond.notify_all()
+
+# ============= EOF =============================================
@@ -0,0 +1,134 @@
+# ===============================================================================
+# Copyright 2015 Jake Ross
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+Background writer that encodes and saves stills off the camera threads
+"""
+# ============= standard library imports ========================
+import datetime
+import os
+import time
+
+import numpy as np
+# ============= local library imports  ==========================
+import convert
+from worker import EventWorker, BLOCK
+
+
+def pil_encoder(fmt, **options):
+    """
+        return an encoder that saves a frame with PIL, options are passed to
+        Image.save, e.g. pil_encoder('JPEG', quality=95)
+    """
+
+    def encode(data, path):
+        convert.to_pil_image(data).save(path, fmt, **options)
+
+    return encode
+
+
+def npy_encoder(data, path):
+    'save the frame array as is'
+    np.save(path, data)
+
+
+DEFAULT_ENCODERS = {'.png': pil_encoder('PNG', compress_level=1),
+                    '.jpg': pil_encoder('JPEG', quality=95),
+                    '.jpeg': pil_encoder('JPEG', quality=95),
+                    '.tif': pil_encoder('TIFF'),
+                    '.tiff': pil_encoder('TIFF'),
+                    '.bmp': pil_encoder('BMP'),
+                    '.npy': npy_encoder}
+
+
+class ImageWriter(object):
+    """
+        encode and write frames on a background thread.
+
+        file names are made from a template with these fields
+            seq: sequence number of the saved still, starting at 1
+            timestamp: wall clock time in seconds
+            time: the same time as a datetime, e.g. {time:%Y%m%d-%H%M%S}
+            serial: camera serial number
+        e.g. 'still_{serial}_{seq:05d}.png'. The encoder is chosen by the file
+        extension, see set_encoder.
+    """
+
+    def __init__(self, template='still_{seq:05d}.png', maxsize=16, policy=BLOCK, serial=''):
+        self.template = template
+        self.serial = serial
+        self.seq = 0
+        self.written = 0
+        self.errors = 0
+
+        self._encoders = dict(DEFAULT_ENCODERS)
+        self._worker = EventWorker(self._write, maxsize, policy, name='toupcam-writer')
+        self._worker.start()
+
+    def set_encoder(self, ext, encoder):
+        'encoder(data, path) is used for files ending with ext'
+        self._encoders[ext.lower()] = encoder
+
+    def submit(self, data, path=None, future=None):
+        """
+            queue data to be written and return the file name. path overrides
+            the template for this frame, it may contain the same fields.
+            the writer takes ownership of data, do not modify it afterwards.
+            future, a concurrent.futures.Future, is resolved with the file
+            name once it is written, or with the error
+        """
+        self.seq += 1
+        now = time.time()
+        if path is None:
+            path = self.template
+
+        path = path.format(seq=self.seq, timestamp=now, serial=self.serial,
+                           time=datetime.datetime.fromtimestamp(now))
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in self._encoders:
+            raise ValueError('No encoder for "{}"'.format(ext))
+
+        self._worker.post((data, path, future))
+        return path
+
+    def flush(self, timeout=None):
+        'wait until every queued frame is written. return False on timeout'
+        return self._worker.flush(timeout)
+
+    def close(self, timeout=None):
+        'write the queued frames then stop the writer thread'
+        self._worker.stop(timeout)
+
+    def pending(self):
+        return self._worker.qsize()
+
+    # private
+    def _write(self, job, timestamp):
+        data, path, future = job
+        encoder = self._encoders[os.path.splitext(path)[1].lower()]
+        try:
+            encoder(data, path)
+            self.written += 1
+        except BaseException as e:
+            self.errors += 1
+            if future is not None:
+                future.set_exception(e)
+            raise
+
+        if future is not None:
+            future.set_result(path)
+
+# ============= EOF =============================================